@@ -1,2 +1,2 @@
-__default_app_config__ = "django_event_sourcing.apps.DjangoEventSourcingConfig"
+default_app_config = "django_event_sourcing.apps.DjangoEventSourcingConfig"
 __version__ = "0.1.0"
@@ -2,5 +2,13 @@ from django.contrib import admin
 
 from .models import Event
 
-# Register your models here.
-admin.site.register(Event)
+
+@admin.register(Event)
+class EventAdmin(admin.ModelAdmin):
+    list_display = ("id", "type", "created_at", "created_by")
+    list_filter = ("type",)
+
+    def get_queryset(self, request):
+        # Payloads can be large and are only shown on the change page, where
+        # the deferred column is loaded on access.
+        return super().get_queryset(request).without_data()
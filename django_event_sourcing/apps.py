@@ -1,5 +1,34 @@
+import logging
+
 from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+logger = logging.getLogger(__name__)
 
 
 class DjangoEventSourcingConfig(AppConfig):
     name = "django_event_sourcing"
+
+    def ready(self):
+        from .globals import (
+            get_event_handler_register,
+            get_event_type_register,
+            lock,
+        )
+
+        # Registers are built up front, so the first request doesn't pay for
+        # importing every event type and handlers don't depend on import order.
+        autodiscover_modules("event_handlers")
+
+        with lock:
+            event_types = get_event_type_register()
+            event_types.freeze()
+            event_handlers = get_event_handler_register()
+            event_handlers.freeze()
+
+        logger.info(
+            "Registered %d event types, %d event handlers and %d side effects.",
+            len(event_types),
+            sum(len(handlers) for handlers in event_handlers.handlers.values()),
+            sum(len(effects) for effects in event_handlers.side_effects.values()),
+        )
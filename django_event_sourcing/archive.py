@@ -0,0 +1,257 @@
+import json
+import os
+import pathlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from . import routers
+from .models import Event, EventHandlerLog, EventSideEffectLog, ModelJSONEncoder
+from .serialization import (
+    COMPRESSION_EXTENSIONS,
+    instance_to_record,
+    open_compressed,
+    record_to_instance,
+)
+
+INDEX_SUFFIX = ".index.json"
+
+# Seconds a directory has to be unchanged before its listing is trusted, since
+# some filesystems only record modification times to the second.
+MTIME_GRANULARITY = 2
+
+_index_caches = {}
+_index_caches_lock = threading.Lock()
+
+
+class _IndexCache:
+    """The indexes of an archive root, shared by every `EventArchive` on it."""
+
+    def __init__(self):
+        self.mtime = None
+        self.indexes = {}
+        self.ordered = None
+        self.segments_by_id = {}
+
+    def add(self, index):
+        self.indexes[index["segment"]] = index
+        for pk in index["ids"]:
+            self.segments_by_id[pk] = index["segment"]
+        self.ordered = None
+
+    def remove(self, segment):
+        index = self.indexes.pop(segment, None)
+        if index is not None:
+            for pk in index["ids"]:
+                if self.segments_by_id.get(pk) == segment:
+                    del self.segments_by_id[pk]
+            self.ordered = None
+
+    def get_ordered(self):
+        if self.ordered is None:
+            self.ordered = sorted(
+                self.indexes.values(), key=lambda index: index["start"]
+            )
+        return self.ordered
+
+
+class EventArchive:
+    """Append-only compressed JSON lines segments of archived events.
+
+    Every segment has an index file alongside it holding the ids and time range
+    of its events, so lookups only decompress the segments that can match.
+    Indexes are cached per root and only re-read when the directory changes.
+    """
+
+    def __init__(self, root=None):
+        self.root = pathlib.Path(root or settings.EVENT_ARCHIVE_ROOT)
+        with _index_caches_lock:
+            self._cache = _index_caches.setdefault(self.root.resolve(), _IndexCache())
+
+    def write_segment(self, events, compression="gzip"):
+        """Writes events, with their logs, as a new segment and returns its index."""
+        events = sorted(events, key=lambda event: (event.created_at, str(event.pk)))
+        start, end = events[0].created_at, events[-1].created_at
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        name = "events-{}-{}.jsonl{}".format(
+            start.strftime("%Y%m%dT%H%M%S"),
+            uuid.uuid4().hex[:8],
+            COMPRESSION_EXTENSIONS[compression],
+        )
+
+        self._write(
+            name,
+            compression,
+            (
+                json.dumps(self._to_record(event), cls=ModelJSONEncoder)
+                for event in events
+            ),
+        )
+
+        index = {
+            "segment": name,
+            "compression": compression,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "ids": [str(event.pk) for event in events],
+        }
+        self._write(name + INDEX_SUFFIX, None, [json.dumps(index)])
+        with _index_caches_lock:
+            self._cache.add(index)
+        return index
+
+    def remove_segment(self, index):
+        """Removes a segment that was written but never committed."""
+        with _index_caches_lock:
+            self._cache.remove(index["segment"])
+        (self.root / (index["segment"] + INDEX_SUFFIX)).unlink(missing_ok=True)
+        (self.root / index["segment"]).unlink(missing_ok=True)
+
+    def indexes(self):
+        """Returns the index of every segment, oldest first."""
+        self._refresh()
+        with _index_caches_lock:
+            return self._cache.get_ordered()
+
+    def get(self, pk):
+        """Returns an archived event or raises `Event.DoesNotExist`."""
+        self._refresh()
+        pk = str(pk)
+        segment = self._cache.segments_by_id.get(pk)
+        if segment is not None:
+            for record in self._read(self._cache.indexes[segment]):
+                if record["id"] == pk:
+                    return self._to_event(record)
+
+        raise Event.DoesNotExist(f"Event {pk} is not archived.")
+
+    def iterate(self, start=None, end=None, types=None):
+        """Yields archived events in creation order, filtered by time and type."""
+        types = None if types is None else {str(type) for type in types}
+        for index in self.indexes():
+            if start and parse_datetime(index["end"]) < start:
+                continue
+            if end and parse_datetime(index["start"]) >= end:
+                continue
+
+            for record in self._read(index):
+                event = self._to_event(record)
+                if start and event.created_at < start:
+                    continue
+                if end and event.created_at >= end:
+                    continue
+                if types is not None and record["type"] not in types:
+                    continue
+                yield event
+
+    def _refresh(self):
+        try:
+            mtime = self.root.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        with _index_caches_lock:
+            if mtime is not None and mtime == self._cache.mtime:
+                return
+
+            segments = set()
+            if mtime is not None:
+                for path in self.root.glob("*" + INDEX_SUFFIX):
+                    segment = path.name[: -len(INDEX_SUFFIX)]
+                    segments.add(segment)
+                    if segment not in self._cache.indexes:
+                        with open(path, encoding="utf-8") as file:
+                            self._cache.add(json.load(file))
+
+            for segment in set(self._cache.indexes) - segments:
+                self._cache.remove(segment)
+
+            recent = time.time_ns() - MTIME_GRANULARITY * 10**9
+            self._cache.mtime = mtime if mtime is not None and mtime < recent else None
+
+    def _write(self, name, compression, lines):
+        path = self.root / name
+        temporary_path = path.with_name(path.name + ".tmp")
+
+        if compression:
+            file = open_compressed(temporary_path, "w", compression)
+        else:
+            file = open(temporary_path, "w", encoding="utf-8")
+
+        with file:
+            for line in lines:
+                file.write(line + "\n")
+
+        with open(temporary_path, "rb") as file:
+            os.fsync(file.fileno())
+        os.replace(temporary_path, path)
+
+    def _read(self, index):
+        with open_compressed(
+            self.root / index["segment"], "r", index["compression"]
+        ) as file:
+            for line in file:
+                yield json.loads(line)
+
+    def _to_record(self, event):
+        record = instance_to_record(event)
+        record["handler_logs"] = []
+        for handler_log in event.handler_logs.all():
+            handler_log_record = instance_to_record(handler_log)
+            handler_log_record["side_effect_logs"] = [
+                instance_to_record(side_effect_log)
+                for side_effect_log in handler_log.side_effect_logs.all()
+            ]
+            record["handler_logs"].append(handler_log_record)
+        return record
+
+    def _to_event(self, record):
+        event = record_to_instance(Event, record)
+        event.archived = True
+        return event
+
+
+def archive_events(before, compression="gzip", segment_size=10000, root=None):
+    """Moves events created before a cutoff, and their logs, into the archive."""
+    archive = EventArchive(root)
+    archived = 0
+    while True:
+        # Read from the primary, which the rows are deleted from.
+        with routers.read_after_write():
+            events = list(
+                Event.objects.filter(created_at__lt=before)
+                .order_by("created_at", "id")
+                .prefetch_related("handler_logs__side_effect_logs")[:segment_size]
+            )
+        if not events:
+            return archived
+
+        ids = [event.pk for event in events]
+        index = None
+        try:
+            with routers.atomic():
+                for chunk in _chunks(ids, 500):
+                    EventSideEffectLog.objects.filter(
+                        handler_log__event__in=chunk
+                    ).delete()
+                    EventHandlerLog.objects.filter(event__in=chunk).delete()
+                    Event.objects.filter(pk__in=chunk).delete()
+
+                # Written last so the rows are only removed once the segment is
+                # durable, and the segment is discarded if the delete fails.
+                index = archive.write_segment(events, compression)
+        except Exception:
+            if index is not None:
+                archive.remove_segment(index)
+            raise
+
+        archived += len(events)
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
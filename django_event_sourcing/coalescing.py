@@ -0,0 +1,71 @@
+import logging
+import threading
+
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class CoalescedRuns:
+    """Runs coalesced within a window, made once each when their window closes.
+
+    Only the latest value added for a key is kept, and it is passed to `run` at
+    the deadline of the first, from a daemon thread when `background`. Values
+    still pending when the process exits are lost.
+    """
+
+    def __init__(self, run, background=True):
+        self.run = run
+        self.background = background
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def add(self, key, deadline, value):
+        with self.condition:
+            if key in self.pending:
+                deadline, _ = self.pending[key]
+            self.pending[key] = (deadline, value)
+
+            if self.background and self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run_forever, name="coalesced-runs", daemon=True
+                )
+                self.thread.start()
+            self.condition.notify()
+
+    def run_due(self, force=False):
+        """Runs the values whose window has closed, or all of them when `force`.
+
+        Returns how many were run.
+        """
+        now = timezone.now()
+        with self.condition:
+            due = [
+                key
+                for key, (deadline, _) in self.pending.items()
+                if force or deadline <= now
+            ]
+            values = [self.pending.pop(key)[1] for key in due]
+
+        for value in values:
+            try:
+                self.run(value)
+            except Exception:
+                logger.exception("Failed to make coalesced run %r.", value)
+        return len(values)
+
+    def _run_forever(self):
+        while True:
+            with self.condition:
+                if self.pending:
+                    deadline = min(deadline for deadline, _ in self.pending.values())
+                    self.condition.wait((deadline - timezone.now()).total_seconds())
+                else:
+                    self.condition.wait()
+
+            try:
+                self.run_due()
+            finally:
+                connections.close_all()
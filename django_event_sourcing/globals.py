@@ -1,8 +1,12 @@
+import threading
+
 from django.conf import settings
 
+lock = threading.RLock()
 
 event_type_register = None
 event_handler_register = None
+event_upcaster_register = None
 
 
 def get_event_type_register():
@@ -11,7 +15,9 @@ def get_event_type_register():
     global event_type_register
 
     if event_type_register is None:
-        event_type_register = EventTypeRegister(settings.EVENT_TYPES)
+        with lock:
+            if event_type_register is None:
+                event_type_register = EventTypeRegister(settings.EVENT_TYPES)
 
     return event_type_register
 
@@ -22,6 +28,21 @@ def get_event_handler_register():
     global event_handler_register
 
     if event_handler_register is None:
-        event_handler_register = EventHandlerRegister()
+        with lock:
+            if event_handler_register is None:
+                event_handler_register = EventHandlerRegister()
 
     return event_handler_register
+
+
+def get_event_upcaster_register():
+    from .registers import EventUpcasterRegister
+
+    global event_upcaster_register
+
+    if event_upcaster_register is None:
+        with lock:
+            if event_upcaster_register is None:
+                event_upcaster_register = EventUpcasterRegister()
+
+    return event_upcaster_register
@@ -0,0 +1,55 @@
+import collections
+
+from django.apps import apps
+
+
+def hydrate_events(events):
+    """Sets `event.references` to the instances referenced by the payload, and
+    fills `created_by`.
+
+    References are declared by `EventType.get_model_references()` and resolved
+    with one `in_bulk` query per model across all of the events. References to
+    rows that no longer exist are `None`. The payload itself is left as stored,
+    so saving an event after handling it doesn't change it.
+    """
+    events = list(events)
+    pks = collections.defaultdict(set)
+    references = []
+
+    for event in events:
+        event.references = {}
+        created_by_field = event._meta.get_field("created_by")
+        if not created_by_field.is_cached(event) and event.created_by_id is not None:
+            pks[created_by_field.related_model].add(event.created_by_id)
+
+        for key, model in event.type.get_model_references().items():
+            if not isinstance(event.data, dict) or event.data.get(key) is None:
+                continue
+
+            if isinstance(model, str):
+                model = apps.get_model(model)
+            values = event.data[key]
+            is_list = isinstance(values, list)
+            values = [
+                model._meta.pk.to_python(value)
+                for value in (values if is_list else [values])
+            ]
+            pks[model].update(values)
+            references.append((event, key, model, values, is_list))
+
+    instances = {
+        model: model._default_manager.in_bulk(model_pks)
+        for model, model_pks in pks.items()
+    }
+
+    for event in events:
+        created_by_field = event._meta.get_field("created_by")
+        if not created_by_field.is_cached(event) and event.created_by_id is not None:
+            users = instances[created_by_field.related_model]
+            created_by_field.set_cached_value(event, users.get(event.created_by_id))
+
+    for event, key, model, values, is_list in references:
+        hydrated = [instances[model].get(value) for value in values]
+        event.references[key] = hydrated if is_list else hydrated[0]
+
+    return events
@@ -0,0 +1,19 @@
+import argparse
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+def datetime_argument(value):
+    """Parses an ISO 8601 date or datetime command line argument."""
+    parsed = parse_datetime(value)
+    if parsed is None and parse_date(value):
+        parsed = datetime.datetime.combine(parse_date(value), datetime.time())
+    if parsed is None:
+        raise argparse.ArgumentTypeError(f"Invalid datetime: {value}")
+
+    if settings.USE_TZ and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
@@ -0,0 +1,44 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...archive import archive_events
+from ...serialization import COMPRESSION_EXTENSIONS
+from ..arguments import datetime_argument
+
+
+class Command(BaseCommand):
+    help = "Moves old events and their logs into compressed archive segments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before",
+            type=datetime_argument,
+            help="Archive events created before this ISO 8601 datetime.",
+        )
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=365,
+            help="Archive events older than this many days, if --before is not given.",
+        )
+        parser.add_argument(
+            "--compression", choices=sorted(COMPRESSION_EXTENSIONS), default="gzip"
+        )
+        parser.add_argument(
+            "--segment-size",
+            type=int,
+            default=10000,
+            help="Maximum number of events per segment.",
+        )
+
+    def handle(
+        self, *args, before, older_than_days, compression, segment_size, **options
+    ):
+        cutoff = before or timezone.now() - datetime.timedelta(days=older_than_days)
+
+        archived = archive_events(
+            cutoff, compression=compression, segment_size=segment_size
+        )
+        self.stdout.write(f"Archived {archived} events created before {cutoff}.")
@@ -0,0 +1,56 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...globals import get_event_type_register
+from ...models import Event
+from ...serialization import COMPRESSION_EXTENSIONS, open_compressed, write_events
+from ..arguments import datetime_argument
+
+
+class Command(BaseCommand):
+    help = "Streams events to a compressed JSON lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help='The file to write to, or "-" for stdout.')
+        parser.add_argument(
+            "--compression", choices=sorted(COMPRESSION_EXTENSIONS), default="gzip"
+        )
+        parser.add_argument(
+            "--type",
+            action="append",
+            dest="types",
+            help="Only export events of this fully qualified type. Repeatable.",
+        )
+        parser.add_argument(
+            "--since",
+            type=datetime_argument,
+            help="Only export events created at or after this datetime.",
+        )
+        parser.add_argument(
+            "--until",
+            type=datetime_argument,
+            help="Only export events created before this datetime.",
+        )
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(
+        self, *args, output, compression, types, since, until, batch_size, **options
+    ):
+        queryset = Event.objects.order_by("created_at", "id")
+        if types:
+            event_types = get_event_type_register()
+            unknown_types = set(types) - set(event_types)
+            if unknown_types:
+                raise CommandError(f"Unknown event types: {sorted(unknown_types)}")
+            queryset = queryset.filter(type__in=[event_types[type] for type in types])
+        if since:
+            queryset = queryset.filter(created_at__gte=since)
+        if until:
+            queryset = queryset.filter(created_at__lt=until)
+
+        file = sys.stdout.buffer if output == "-" else output
+        with open_compressed(file, "w", compression) as stream:
+            count = write_events(queryset.iterator(chunk_size=batch_size), stream)
+
+        self.stderr.write(f"Exported {count} events.")
@@ -0,0 +1,65 @@
+import itertools
+import sys
+
+from django.core.management.base import BaseCommand
+
+from ...globals import get_event_handler_register
+from ...models import Event
+from ...routers import read_after_write
+from ...serialization import (
+    COMPRESSION_EXTENSIONS,
+    insert_events,
+    open_compressed,
+    read_events,
+)
+
+
+class Command(BaseCommand):
+    help = "Loads events from a compressed JSON lines file made by export_events."
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help='The file to read from, or "-" for stdin.')
+        parser.add_argument(
+            "--compression",
+            choices=sorted(COMPRESSION_EXTENSIONS),
+            help="Defaults to zstd for .zst files and gzip otherwise.",
+        )
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--handle",
+            action="store_true",
+            help="Run the event handlers for newly imported events.",
+        )
+
+    def handle(self, *args, input, compression, batch_size, handle, **options):
+        if compression is None:
+            compression = "zstd" if input.endswith(".zst") else "gzip"
+
+        file = sys.stdin.buffer if input == "-" else input
+        imported = 0
+        with open_compressed(file, "r", compression) as stream:
+            events = read_events(stream)
+            while batch := list(itertools.islice(events, batch_size)):
+                self.import_batch(batch, handle)
+                imported += len(batch)
+
+        self.stdout.write(
+            f"Imported {imported} events, skipping any that already existed."
+        )
+
+    def import_batch(self, events, handle):
+        pks = [event.pk for event in events]
+        with read_after_write():
+            existing = set()
+            if handle:
+                existing = set(
+                    Event.objects.filter(pk__in=pks).values_list("pk", flat=True)
+                )
+
+            insert_events(events)
+
+            if handle:
+                new_pks = [pk for pk in pks if pk not in existing]
+                get_event_handler_register().handle_many(
+                    Event.objects.filter(pk__in=new_pks).order_by("created_at", "id")
+                )
@@ -0,0 +1,79 @@
+import functools
+import operator
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from ...globals import get_event_type_register
+from ...models import Event
+from ...routers import read_after_write
+
+
+class Command(BaseCommand):
+    help = "Rewrites stored event payloads to the latest version of their type."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--type",
+            action="append",
+            dest="types",
+            help="Only upcast events of this fully qualified type. Repeatable.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--after",
+            help="Resume after this event id, as printed by a previous run.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0,
+            help="Seconds to sleep between batches to throttle the load.",
+        )
+
+    def handle(self, *args, types, batch_size, after, sleep, **options):
+        event_types = [
+            event_type
+            for event_type in get_event_type_register().values()
+            if event_type.get_version() > 1
+            and (types is None or event_type.fully_qualified_value in types)
+        ]
+        if not event_types:
+            self.stdout.write("No event types have newer payload versions.")
+            return
+
+        outdated = functools.reduce(
+            operator.or_,
+            (
+                Q(type=event_type, data_version__lt=event_type.get_version())
+                for event_type in event_types
+            ),
+        )
+        queryset = (
+            Event.objects.filter(outdated)
+            .only("id", "type", "data", "data_version")
+            .order_by("id")
+        )
+
+        upcast = 0
+        while True:
+            batch_queryset = queryset.filter(id__gt=after) if after else queryset
+            # Read from the primary, so a lagging replica can't undo writes.
+            with read_after_write():
+                events = list(batch_queryset[:batch_size])
+            if not events:
+                break
+
+            for event in events:
+                event.data  # Upcasts the payload and its version on access.
+
+            Event.objects.bulk_update(events, ["data", "data_version"])
+            upcast += len(events)
+            after = events[-1].pk
+            self.stdout.write(f"Upcast {upcast} events, last id {after}.")
+
+            if sleep:
+                time.sleep(sleep)
+
+        self.stdout.write(f"Upcast {upcast} events.")
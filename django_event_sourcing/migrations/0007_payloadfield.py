@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-19 06:33
+
+from django.db import migrations
+import django_event_sourcing.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_event_sourcing", "0006_auto_20210324_1610"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="event",
+            name="data",
+            field=django_event_sourcing.models.PayloadField(
+                encoder=django_event_sourcing.models.ModelJSONEncoder
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.25 on 2026-10-19 06:36
+
+from django.db import migrations
+import django_event_sourcing.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_event_sourcing", "0007_payloadfield"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="data_version",
+            field=django_event_sourcing.models.DataVersionField(default=1),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2.25 on 2026-10-19 06:38
+
+from django.conf import settings
+from django.db import migrations
+import django.db.models.deletion
+import django.db.models.manager
+import django_event_sourcing.models
+from django_event_sourcing import routers
+
+
+class AlterRoutedForeignKey(migrations.AlterField):
+    """Only drops the foreign key constraint when the tables are routed to
+    separate databases, so single database installs keep theirs untouched.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if routers.spans_databases():
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if routers.spans_databases():
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("django_event_sourcing", "0008_event_data_version"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="event",
+            options={"base_manager_name": "routed_objects"},
+        ),
+        migrations.AlterModelOptions(
+            name="eventhandlerlog",
+            options={"base_manager_name": "routed_objects"},
+        ),
+        migrations.AlterModelManagers(
+            name="event",
+            managers=[
+                ("objects", django.db.models.manager.Manager()),
+                ("routed_objects", django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name="eventhandlerlog",
+            managers=[
+                ("objects", django.db.models.manager.Manager()),
+                ("routed_objects", django.db.models.manager.Manager()),
+            ],
+        ),
+        AlterRoutedForeignKey(
+            model_name="event",
+            name="created_by",
+            field=django_event_sourcing.models.RoutedForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="events",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        AlterRoutedForeignKey(
+            model_name="eventhandlerlog",
+            name="event",
+            field=django_event_sourcing.models.RoutedForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="handler_logs",
+                to="django_event_sourcing.event",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.25 on 2026-10-19 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_event_sourcing", "0009_cross_database_relations"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="idempotency_key",
+            field=models.CharField(
+                blank=True, editable=False, max_length=255, null=True, unique=True
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-19 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_event_sourcing", "0010_event_idempotency_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="eventsideeffectlog",
+            name="coalesce_key",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name="eventsideeffectlog",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("processing", "Processing"),
+                    ("failed", "Failed"),
+                    ("success", "Success"),
+                    ("skipped", "Skipped"),
+                    ("coalesced", "Coalesced"),
+                ],
+                db_index=True,
+                default="processing",
+                max_length=12,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="eventsideeffectlog",
+            index=models.Index(
+                fields=["name", "coalesce_key", "created_at"],
+                name="django_even_name_5991eb_idx",
+            ),
+        ),
+    ]
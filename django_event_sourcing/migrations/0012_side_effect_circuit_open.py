@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-19 06:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_event_sourcing", "0011_side_effect_coalescing"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="eventsideeffectlog",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("processing", "Processing"),
+                    ("failed", "Failed"),
+                    ("success", "Success"),
+                    ("skipped", "Skipped"),
+                    ("coalesced", "Coalesced"),
+                    ("circuit_open", "Circuit Open"),
+                ],
+                db_index=True,
+                default="processing",
+                max_length=12,
+            ),
+        ),
+    ]
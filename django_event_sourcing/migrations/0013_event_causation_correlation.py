@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-19 06:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_event_sourcing", "0012_side_effect_circuit_open"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="causation_id",
+            field=models.UUIDField(
+                blank=True, db_index=True, editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="correlation_id",
+            field=models.UUIDField(
+                blank=True, db_index=True, editable=False, null=True
+            ),
+        ),
+    ]
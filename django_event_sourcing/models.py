@@ -1,11 +1,44 @@
+import base64
+import contextlib
+import contextvars
 import enum
+import json
 import uuid
+import zlib
 
 from django.conf import settings
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db import models
-
-from .globals import get_event_handler_register, get_event_type_register
+from django.db import NotSupportedError, connections, models, router
+from django.db.models.fields.json import KeyTransform
+from django.db.models import sql
+from django.db.models.query import (
+    FlatValuesListIterable,
+    NamedValuesListIterable,
+    ValuesIterable,
+    ValuesListIterable,
+)
+from django.db.models.query_utils import DeferredAttribute
+from django.utils.functional import SimpleLazyObject, empty
+
+from . import routers
+from .globals import (
+    get_event_handler_register,
+    get_event_type_register,
+    get_event_upcaster_register,
+)
+from .hydration import hydrate_events
+
+_causing_event = contextvars.ContextVar("causing_event", default=None)
+
+
+@contextlib.contextmanager
+def causing_event(event):
+    """Marks events created inside the block as caused by `event`."""
+    token = _causing_event.set(event)
+    try:
+        yield
+    finally:
+        _causing_event.reset(token)
 
 
 class EventType(str, enum.Enum):
@@ -15,6 +48,17 @@ class EventType(str, enum.Enum):
     def fully_qualified_value(self):
         return self.get_namespace() + "." + self.value
 
+    def get_version(self):
+        """The current version of this event type's payload shape."""
+        return 1
+
+    def get_model_references(self):
+        """Maps payload keys holding primary keys to their model or model label.
+
+        These are hydrated into instances before the event is handled.
+        """
+        return {}
+
     def __hash__(self):
         return hash(self.fully_qualified_value)
 
@@ -49,12 +93,225 @@ class EventTypeField(models.CharField):
         return event_type.fully_qualified_value
 
 
-class EventManager(models.Manager):
-    def create_and_handle(self, **kwargs):
-        event = self.create(**kwargs)
-        result = event.handle()
+def _atomic(atomic):
+    return routers.atomic() if atomic else contextlib.nullcontext()
+
+
+class DataVersionField(models.PositiveIntegerField):
+    """Stores the payload version, defaulting to the event type's current version."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs["editable"] = False
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        del kwargs["editable"]
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        value = super().pre_save(model_instance, add)
+        if add and value is None:
+            value = model_instance.type.get_version()
+            setattr(model_instance, self.attname, value)
+        return value
+
+
+def _decode_values(values):
+    """Decodes the payloads in a row, and upcasts its data if it has the type
+    and version too.
+    """
+    for name, value in values.items():
+        if isinstance(value, LazyPayload):
+            values[name] = value.decode()
+
+    if "data" in values and "data_version" in values and "type" in values:
+        values["data"], values["data_version"] = upcast_payload(
+            values["type"], values["data_version"], values["data"]
+        )
+    return values
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, LazyPayload) else value
+
+
+class PayloadValuesIterable(ValuesIterable):
+    def __iter__(self):
+        for row in super().__iter__():
+            yield _decode_values(row)
+
+
+class PayloadValuesListIterable(ValuesListIterable):
+    def __iter__(self):
+        for row in super().__iter__():
+            yield tuple(_decode(value) for value in row)
+
+
+class PayloadNamedValuesListIterable(NamedValuesListIterable):
+    def __iter__(self):
+        for row in super().__iter__():
+            yield row._replace(**_decode_values(row._asdict()))
+
+
+class PayloadFlatValuesListIterable(FlatValuesListIterable):
+    def __iter__(self):
+        for value in super().__iter__():
+            yield _decode(value)
+
+
+PAYLOAD_ITERABLE_CLASSES = {
+    ValuesIterable: PayloadValuesIterable,
+    ValuesListIterable: PayloadValuesListIterable,
+    NamedValuesListIterable: PayloadNamedValuesListIterable,
+    FlatValuesListIterable: PayloadFlatValuesListIterable,
+}
+
+
+class EventQuerySet(models.QuerySet):
+    def values(self, *fields, **expressions):
+        return super().values(*fields, **expressions)._decode_payloads()
+
+    def values_list(self, *fields, flat=False, named=False):
+        return super().values_list(*fields, flat=flat, named=named)._decode_payloads()
+
+    def _decode_payloads(self):
+        # Rows hold payloads decoded, as they are loaded lazily for instances.
+        self._iterable_class = PAYLOAD_ITERABLE_CLASSES.get(
+            self._iterable_class, self._iterable_class
+        )
+        return self
+
+    def without_data(self):
+        """Leaves the payload column out, for listings that don't need it."""
+        return self.defer("data")
+
+    def correlated_with(self, event):
+        """Filters to the events in the same causal chain as an event."""
+        return self.filter(correlation_id=event.correlation_id or event.pk)
+
+    def handle(self, skip_side_effects=False, atomic=False):
+        """Handles every event in creation order, hydrating references in batches.
+
+        When `atomic`, all of the events are handled under a single commit.
+        """
+        return get_event_handler_register().handle_many(
+            self.order_by("created_at", "id").iterator(),
+            skip_side_effects=skip_side_effects,
+            atomic=atomic,
+        )
+
+
+class EventManager(models.Manager.from_queryset(EventQuerySet)):
+    def create_and_handle(self, *, atomic=False, idempotency_key=None, **kwargs):
+        """Creates and handles an event, in one transaction when `atomic`.
+
+        When an event with the same `idempotency_key` already exists, it is
+        returned with its handler logs and isn't handled again.
+        """
+        with _atomic(atomic):
+            if idempotency_key is None:
+                event = self.create(**kwargs)
+            else:
+                event = self.model(idempotency_key=idempotency_key, **kwargs)
+                event.set_lineage()
+                if not self._insert_unless_exists(event):
+                    with routers.read_after_write():
+                        event = self.get(idempotency_key=idempotency_key)
+                        return event, list(event.handler_logs.all())
+
+            result = event.handle(atomic=atomic)
         return event, result
 
+    def _insert_unless_exists(self, event):
+        """Inserts an event with a single `INSERT ... ON CONFLICT DO NOTHING`.
+
+        Returns whether it was inserted, rather than conflicting with an existing
+        event.
+        """
+        using = router.db_for_write(self.model, instance=event)
+        connection = connections[using]
+        if not connection.features.supports_ignore_conflicts:
+            raise NotSupportedError(
+                "This database backend does not support idempotency keys."
+            )
+
+        query = sql.InsertQuery(self.model, ignore_conflicts=True)
+        query.insert_values(self.model._meta.concrete_fields, [event])
+        with connection.cursor() as cursor:
+            for statement, params in query.get_compiler(using=using).as_sql():
+                cursor.execute(statement, params)
+            inserted = cursor.rowcount == 1
+
+        event._state.adding = False
+        event._state.db = using
+        return inserted
+
+    def create_and_handle_many(self, events, *, atomic=True):
+        """Creates and handles events from keyword arguments, group committing them."""
+        with _atomic(atomic):
+            return [
+                self.create_and_handle(atomic=atomic, **kwargs) for kwargs in events
+            ]
+
+    def get_causal_tree(self, root):
+        """Returns an event and every event it caused, in creation order.
+
+        The tree is fetched with a single recursive query over `causation_id`.
+        """
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        table = quote_name(self.model._meta.db_table)
+        pk_column = quote_name(self.model._meta.pk.column)
+        causation_column = quote_name(self.model._meta.get_field("causation_id").column)
+        created_at_column = quote_name(self.model._meta.get_field("created_at").column)
+
+        pk = self.model._meta.pk.get_db_prep_value(
+            getattr(root, "pk", root), connection
+        )
+        return list(
+            self.raw(
+                f"WITH RECURSIVE tree (id) AS ("
+                f"SELECT {pk_column} FROM {table} WHERE {pk_column} = %s "
+                f"UNION ALL "
+                f"SELECT caused.{pk_column} FROM {table} caused "
+                f"INNER JOIN tree ON caused.{causation_column} = tree.id"
+                f") "
+                f"SELECT {table}.* FROM {table} "
+                f"INNER JOIN tree ON {table}.{pk_column} = tree.id "
+                f"ORDER BY {table}.{created_at_column}",
+                [pk],
+            )
+        )
+
+    def get_including_archived(self, pk):
+        """Gets an event, reading through to the archive if it has been archived."""
+        try:
+            return self.get(pk=pk)
+        except self.model.DoesNotExist:
+            if not getattr(settings, "EVENT_ARCHIVE_ROOT", None):
+                raise
+
+        from .archive import EventArchive
+
+        return EventArchive().get(pk)
+
+    def iterate_including_archived(self, start=None, end=None, types=None):
+        """Yields archived and then stored events in creation order for replays."""
+        if getattr(settings, "EVENT_ARCHIVE_ROOT", None):
+            from .archive import EventArchive
+
+            yield from EventArchive().iterate(start=start, end=end, types=types)
+
+        queryset = self.order_by("created_at", "id")
+        if start:
+            queryset = queryset.filter(created_at__gte=start)
+        if end:
+            queryset = queryset.filter(created_at__lt=end)
+        if types is not None:
+            queryset = queryset.filter(type__in=types)
+        yield from queryset.iterator()
+
 
 class ModelJSONEncoder(DjangoJSONEncoder):
     """Encodes a model by getting the primary key."""
@@ -65,26 +322,216 @@ class ModelJSONEncoder(DjangoJSONEncoder):
         return super().default(obj)
 
 
+COMPRESSED_PAYLOAD_KEY = "$zlib"
+
+
+def decode_payload(value, decoder=None):
+    """Decodes a payload as stored in the database, decompressing if needed."""
+    if isinstance(value, str):
+        value = json.loads(value, cls=decoder)
+
+    if isinstance(value, dict) and value.keys() == {COMPRESSED_PAYLOAD_KEY}:
+        compressed = base64.b64decode(value[COMPRESSED_PAYLOAD_KEY])
+        value = json.loads(zlib.decompress(compressed), cls=decoder)
+
+    return value
+
+
+def upcast_payload(event_type, version, data):
+    """Upgrades a payload to the latest version of its event type.
+
+    Returns the payload and the version it is now at.
+    """
+    latest_version = event_type.get_version()
+    if version is None or version >= latest_version:
+        return data, version
+
+    data = get_event_upcaster_register().upcast(event_type, version, data)
+    return data, latest_version
+
+
+class LazyPayload(SimpleLazyObject):
+    """A payload loaded from the database that is only decoded on first use."""
+
+    def __init__(self, raw, decoder=None):
+        self.__dict__["raw"] = raw
+        super().__init__(lambda: decode_payload(raw, decoder))
+
+    @property
+    def is_decoded(self):
+        return self._wrapped is not empty
+
+    def decode(self):
+        if self._wrapped is empty:
+            self._setup()
+        return self._wrapped
+
+
+class PayloadDescriptor(DeferredAttribute):
+    """Decodes a lazily loaded payload when the attribute is first accessed."""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+
+        value = super().__get__(instance, cls)
+        if isinstance(value, LazyPayload):
+            value = value.decode()
+            if hasattr(instance, "upcast_payload"):
+                value = instance.upcast_payload(value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class PayloadField(models.JSONField):
+    """Stores JSON that is decoded lazily.
+
+    Payloads larger than `settings.EVENT_DATA_COMPRESSION_THRESHOLD` bytes are
+    stored zlib compressed, which also means they can't be queried by key.
+    """
+
+    descriptor_class = PayloadDescriptor
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or isinstance(expression, KeyTransform):
+            return super().from_db_value(value, expression, connection)
+
+        return LazyPayload(value, self.decoder)
+
+    def pre_save(self, model_instance, add):
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, LazyPayload):
+            return value
+
+        return super().pre_save(model_instance, add)
+
+    def get_prep_value(self, value):
+        if isinstance(value, LazyPayload):
+            if not value.is_decoded and isinstance(value.raw, str):
+                return value.raw  # Unchanged, so save it as it was loaded.
+            value = value.decode()
+
+        encoded = super().get_prep_value(value)
+        threshold = getattr(settings, "EVENT_DATA_COMPRESSION_THRESHOLD", None)
+        if encoded is None or threshold is None or len(encoded) <= threshold:
+            return encoded
+
+        compressed = zlib.compress(encoded.encode())
+        return json.dumps(
+            {COMPRESSED_PAYLOAD_KEY: base64.b64encode(compressed).decode("ascii")}
+        )
+
+
+class RoutedForeignKey(models.ForeignKey):
+    """A foreign key with a database constraint unless the event sourcing tables
+    are routed to separate databases, where one can't be enforced.
+    """
+
+    @property
+    def db_constraint(self):
+        return not routers.spans_databases()
+
+    @db_constraint.setter
+    def db_constraint(self, value):
+        pass
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs.pop("db_constraint", None)
+        return name, path, args, kwargs
+
+
+class RoutedManager(models.Manager):
+    """Looks up related rows in the database the model is routed to.
+
+    Used as the base manager, so deletion checks such as `on_delete=PROTECT`
+    look for events and logs where they are stored, not in the database of
+    the object being deleted.
+    """
+
+    def using(self, alias):
+        return super().using(routers.get_database_for(self.model, alias))
+
+
 class Event(models.Model):
     """Represents an action that will happen."""
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     type = EventTypeField()
-    data = models.JSONField(encoder=ModelJSONEncoder)
+    data = PayloadField(encoder=ModelJSONEncoder)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
-    created_by = models.ForeignKey(
+    created_by = RoutedForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name="events"
     )
+    data_version = DataVersionField()
+    idempotency_key = models.CharField(
+        max_length=255, null=True, blank=True, unique=True, editable=False
+    )
+    causation_id = models.UUIDField(
+        null=True, blank=True, db_index=True, editable=False
+    )
+    correlation_id = models.UUIDField(
+        null=True, blank=True, db_index=True, editable=False
+    )
 
     objects = EventManager()
+    routed_objects = RoutedManager()
+
+    # Set on events read from the archive, which are no longer stored.
+    archived = False
+
+    class Meta:
+        base_manager_name = "routed_objects"
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.set_lineage()
+        super().save(*args, **kwargs)
 
-    def handle(self):
-        self.refresh_from_db()  # To ensure we haven't got any old references.
-        return get_event_handler_register().handle(self)
+    def set_lineage(self):
+        """Links the event to the event being handled when it was created, if any.
+
+        Events share the correlation id of the first event in their chain.
+        """
+        causing_event = _causing_event.get()
+        if causing_event is not None and self.causation_id is None:
+            self.causation_id = causing_event.pk
+            self.correlation_id = causing_event.correlation_id or causing_event.pk
+
+        if self.correlation_id is None:
+            self.correlation_id = self.pk
+
+    def upcast_payload(self, data):
+        """Upgrades a stored payload to the latest version of the event type."""
+        data, self.data_version = upcast_payload(self.type, self.data_version, data)
+        return data
+
+    def handle(self, atomic=False):
+        with routers.read_after_write():
+            if not self.archived:
+                self.refresh_from_db()  # To ensure we haven't got any old references.
+            hydrate_events([self])
+            return get_event_handler_register().handle(self, atomic=atomic)
 
 
 class EventHandlerLogManager(models.Manager):
     def create_from_function(self, *, function, **kwargs):
+        """Creates a log named after a function.
+
+        Logs of archived events are only built, as there are no rows for them
+        to reference, and are marked as archived so they aren't saved.
+        """
+        instance = getattr(self, "instance", None)
+        if instance is not None and instance.archived:
+            log = self.model(
+                **kwargs, name=function.__name__, **{self.field.name: instance}
+            )
+            log.archived = True
+            return log
+
         return self.create(**kwargs, name=function.__name__)
 
 
@@ -95,7 +542,7 @@ class EventHandlerLog(models.Model):
         SUCCESS = "success"
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    event = models.ForeignKey(
+    event = RoutedForeignKey(
         Event, on_delete=models.PROTECT, related_name="handler_logs"
     )
     status = models.CharField(
@@ -107,6 +554,12 @@ class EventHandlerLog(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     objects = EventHandlerLogManager()
+    routed_objects = RoutedManager()
+
+    archived = False
+
+    class Meta:
+        base_manager_name = "routed_objects"
 
     @property
     def failed(self):
@@ -119,6 +572,8 @@ class EventSideEffectLog(models.Model):
         FAILED = "failed"
         SUCCESS = "success"
         SKIPPED = "skipped"
+        COALESCED = "coalesced"
+        CIRCUIT_OPEN = "circuit_open"
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     handler_log = models.ForeignKey(
@@ -129,7 +584,17 @@ class EventSideEffectLog(models.Model):
     )
     name = models.CharField(max_length=255)
     message = models.TextField(blank=True)
+    coalesce_key = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     objects = EventHandlerLogManager()
+
+    archived = False
+
+    class Meta:
+        indexes = [models.Index(fields=["name", "coalesce_key", "created_at"])]
+
+    @property
+    def failed(self):
+        return self.status == self.Status.FAILED
@@ -1,9 +1,23 @@
 import collections
 from collections.abc import Iterable
+import functools
+import hashlib
+import itertools
+import logging
+import threading
 
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
 from django.utils.module_loading import import_string
 
-from .models import EventType, EventSideEffectLog
+from . import routers
+from .coalescing import CoalescedRuns
+from .hydration import hydrate_events
+from .models import EventType, EventSideEffectLog, _atomic, causing_event
+from .resilience import call_with_timeout
+
+logger = logging.getLogger(__name__)
 
 
 class EventTypeRegister(collections.UserDict):
@@ -11,14 +25,99 @@ class EventTypeRegister(collections.UserDict):
 
     def __init__(self, event_type_classes):
         super().__init__()
+        self.frozen = False
         for event_type_class in event_type_classes:
             event_type_enum = import_string(event_type_class)
             for event_type in event_type_enum:
                 self.data[event_type.fully_qualified_value] = event_type
 
+    def freeze(self):
+        self.frozen = True
+
+    def __setitem__(self, key, value):
+        if self.frozen:
+            raise TypeError("The event type register is frozen.")
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        if self.frozen:
+            raise TypeError("The event type register is frozen.")
+        super().__delitem__(key)
+
+
+class EventUpcasterRegister:
+    """Stores functions upgrading event payloads from one version to the next."""
+
+    def __init__(self):
+        self.upcasters = {}
+        self.chains = {}
+
+    def register(self, *, event_type, version):
+        """Registers a function upgrading payloads at `version` to `version + 1`."""
+
+        def decorator(f):
+            if isinstance(event_type, EventType):
+                self.upcasters[(event_type, version)] = f
+            elif isinstance(event_type, Iterable):
+                for type in event_type:
+                    self.upcasters[(type, version)] = f
+            else:
+                raise TypeError(f"Unknown event type: {event_type}")
+
+            self.chains.clear()
+            return f
+
+        return decorator
+
+    def get_chain(self, event_type, version):
+        """Returns the composed upcasters from `version` to the latest version."""
+        key = (event_type, version)
+        if key not in self.chains:
+            upcasters = []
+            for from_version in range(version, event_type.get_version()):
+                try:
+                    upcasters.append(self.upcasters[(event_type, from_version)])
+                except KeyError:
+                    raise ImproperlyConfigured(
+                        f"No upcaster for version {from_version} of {event_type}."
+                    )
+
+            def chain(data):
+                for upcaster in upcasters:
+                    data = upcaster(data)
+                return data
+
+            self.chains[key] = chain
+
+        return self.chains[key]
+
+    def upcast(self, event_type, version, data):
+        return self.get_chain(event_type, version)(data)
+
 
 RegisteredSideEffect = collections.namedtuple(
-    "RegisteredSideEffect", field_names=("callable", "condition")
+    "RegisteredSideEffect",
+    field_names=(
+        "callable",
+        "condition",
+        "coalesce_key",
+        "coalesce_window",
+        "timeout",
+    ),
+    defaults=(None, None, None),
+)
+
+CoalescedSideEffect = collections.namedtuple(
+    "CoalescedSideEffect",
+    field_names=(
+        "registered_side_effect",
+        "event",
+        "handler_log",
+        "result",
+        "coalesce_key",
+        "coalesced_at",
+    ),
+    defaults=(None,),
 )
 
 
@@ -26,16 +125,41 @@ class EventHandlerRegister:
     """Stores event handlers."""
 
     def __init__(self):
-        self.handlers = collections.defaultdict(lambda: [])
-        self.side_effects = collections.defaultdict(lambda: [])
+        # Registrations replace tuples rather than mutating them, so handling
+        # in other threads never sees a partial registration.
+        self.handlers = {}
+        self.side_effects = {}
+        self.timeouts = {}
+        self.circuit_breakers = {}
+        self.coalesced_runs = CoalescedRuns(self._run_coalesced_side_effect)
+        self.frozen = False
+        self.lock = threading.Lock()
+
+    def freeze(self):
+        """Marks registration as complete, warning about any later registrations."""
+        self.frozen = True
+
+    def _add(self, registry, key, value):
+        with self.lock:
+            if self.frozen:
+                logger.warning(
+                    "%r was registered after the event handler register was frozen.",
+                    value,
+                )
+            registry[key] = (*registry.get(key, ()), value)
+
+    def register(self, *, event_type, timeout=None):
+        """Registers a handler, failing it if it runs over `timeout` seconds."""
 
-    def register(self, *, event_type):
         def decorator(f):
+            if timeout is not None:
+                self.timeouts[f] = timeout
+
             if isinstance(event_type, EventType):
-                self.handlers[event_type].append(f)
+                self._add(self.handlers, event_type, f)
             elif isinstance(event_type, Iterable):
                 for type in event_type:
-                    self.handlers[type].append(f)
+                    self._add(self.handlers, type, f)
             else:
                 raise TypeError(f"Unknown event type: {event_type}")
 
@@ -43,50 +167,270 @@ class EventHandlerRegister:
 
         return decorator
 
-    def register_side_effect(self, callable, *, condition=None):
+    def register_side_effect(
+        self,
+        callable,
+        *,
+        condition=None,
+        coalesce_key=None,
+        coalesce_window=None,
+        timeout=None,
+        circuit_breaker=None,
+    ):
+        """Registers a side effect to run with the result of the decorated handler.
+
+        With `coalesce_key`, a function of the event, a run is recorded as
+        coalesced instead when the side effect already ran with the same key
+        within the `coalesce_window` timedelta. The side effect then runs once
+        more when the window closes, with the result of the latest coalesced run.
+
+        A run fails if it takes over `timeout` seconds. A `CircuitBreaker` is
+        shared by every registration of the side effect, and while it is open
+        runs are recorded as circuit open without being called.
+        """
+        if (coalesce_key is None) != (coalesce_window is None):
+            raise TypeError("coalesce_key and coalesce_window must be given together.")
+
+        if circuit_breaker is not None:
+            with self.lock:
+                registered = self.circuit_breakers.setdefault(callable, circuit_breaker)
+            if registered is not circuit_breaker:
+                raise ValueError(
+                    f"{callable.__name__} already has a different circuit breaker."
+                )
+
         def decorator(f):
-            self.side_effects[f].append(RegisteredSideEffect(callable, condition))
+            self._add(
+                self.side_effects,
+                f,
+                RegisteredSideEffect(
+                    callable, condition, coalesce_key, coalesce_window, timeout
+                ),
+            )
             return f
 
         return decorator
 
-    def _run_event_function(self, log, function, *args, **kwargs):
+    def _run_event_function(
+        self, log, function, *args, atomic=False, timeout=None, **kwargs
+    ):
         result = None
         try:
-            result = function(*args, **kwargs)
+            # A savepoint per function, so a failure only rolls back its own work.
+            with _atomic(atomic):
+                if timeout is None:
+                    result = function(*args, **kwargs)
+                else:
+                    result = call_with_timeout(function, timeout, *args, **kwargs)
             log.status = log.Status.SUCCESS
             log.message = str(result)
         except Exception as error:
             log.status = log.Status.FAILED
             log.message = repr(error)
         finally:
-            log.save()
+            if not log.archived:
+                log.save()
 
         return result
 
-    def handle(self, event, skip_side_effects=False):
-        for handler in self.handlers[event.type]:
-            handler_log = event.handler_logs.create_from_function(function=handler)
-            result = self._run_event_function(handler_log, handler, event)
+    def handle(self, event, skip_side_effects=False, atomic=False):
+        """Runs the handlers and side effects for an event.
 
-            if skip_side_effects or handler_log.failed:
-                continue
+        When `atomic`, everything is committed in one transaction and each
+        handler and side effect runs in its own savepoint. Returns the handler
+        logs.
+        """
+        if atomic or routers.in_atomic_block():
+            self._check_atomic(event, skip_side_effects)
 
-            for registered_side_effect in self.side_effects[handler]:
-                condition_class = registered_side_effect.condition
-                should_run = (
-                    condition_class().has_condition(event) if condition_class else True
+        handler_logs = []
+        with _atomic(atomic), causing_event(event):
+            for handler in self.handlers.get(event.type, ()):
+                handler_log = event.handler_logs.create_from_function(function=handler)
+                handler_logs.append(handler_log)
+                result = self._run_event_function(
+                    handler_log,
+                    handler,
+                    event,
+                    atomic=atomic,
+                    timeout=self.timeouts.get(handler),
                 )
-                status = (
-                    EventSideEffectLog.Status.PROCESSING
-                    if should_run
-                    else EventSideEffectLog.Status.SKIPPED
+
+                if skip_side_effects or handler_log.failed:
+                    continue
+
+                for registered_side_effect in self.side_effects.get(handler, ()):
+                    self._handle_side_effect(
+                        event, handler_log, registered_side_effect, result, atomic
+                    )
+
+        return handler_logs
+
+    def _check_atomic(self, event, skip_side_effects):
+        # Timed functions run in another thread, outside any transaction, where
+        # they can't see the uncommitted event. This includes transactions
+        # around the handling, such as those from ATOMIC_REQUESTS.
+        for handler in self.handlers.get(event.type, ()):
+            timeouts = [self.timeouts.get(handler)]
+            if not skip_side_effects:
+                timeouts += [
+                    registered_side_effect.timeout
+                    for registered_side_effect in self.side_effects.get(handler, ())
+                ]
+            if any(timeout is not None for timeout in timeouts):
+                raise ValueError(
+                    f"{handler.__name__} or its side effects have a timeout, so "
+                    f"{event.type} events can't be handled atomically or "
+                    f"inside a transaction."
                 )
-                side_effect_log = handler_log.side_effect_logs.create_from_function(
-                    function=registered_side_effect.callable, status=status
+
+    def _handle_side_effect(
+        self, event, handler_log, registered_side_effect, result, atomic
+    ):
+        condition_class = registered_side_effect.condition
+        if condition_class and not condition_class().has_condition(event):
+            handler_log.side_effect_logs.create_from_function(
+                function=registered_side_effect.callable,
+                status=EventSideEffectLog.Status.SKIPPED,
+            )
+            return
+
+        coalesce_key = ""
+        if registered_side_effect.coalesce_key:
+            coalesce_key = self._get_coalesce_key(registered_side_effect, event)
+            last_run_at = self._get_last_run_at(registered_side_effect, coalesce_key)
+            if last_run_at is not None:
+                handler_log.side_effect_logs.create_from_function(
+                    function=registered_side_effect.callable,
+                    status=EventSideEffectLog.Status.COALESCED,
+                    coalesce_key=coalesce_key,
+                )
+                # Covers this event with a run once the window closes, as the
+                # last run may have started before the event was written.
+                transaction.on_commit(
+                    functools.partial(
+                        self._add_coalesced_side_effect,
+                        last_run_at + registered_side_effect.coalesce_window,
+                        CoalescedSideEffect(
+                            registered_side_effect,
+                            event,
+                            handler_log,
+                            result,
+                            coalesce_key,
+                        ),
+                    ),
+                    using=routers.get_database("logs"),
                 )
+                return
+
+        self._run_side_effect(
+            handler_log, registered_side_effect, result, coalesce_key, atomic
+        )
+
+    def _run_side_effect(
+        self, handler_log, registered_side_effect, result, coalesce_key, atomic=False
+    ):
+        circuit_breaker = self.circuit_breakers.get(registered_side_effect.callable)
+        if circuit_breaker and not circuit_breaker.allow():
+            handler_log.side_effect_logs.create_from_function(
+                function=registered_side_effect.callable,
+                status=EventSideEffectLog.Status.CIRCUIT_OPEN,
+                coalesce_key=coalesce_key,
+            )
+            return
+
+        side_effect_log = handler_log.side_effect_logs.create_from_function(
+            function=registered_side_effect.callable, coalesce_key=coalesce_key
+        )
+        self._run_event_function(
+            side_effect_log,
+            registered_side_effect.callable,
+            result,
+            atomic=atomic,
+            timeout=registered_side_effect.timeout,
+        )
+
+        if circuit_breaker and side_effect_log.failed:
+            circuit_breaker.record_failure()
+        elif circuit_breaker:
+            circuit_breaker.record_success()
+
+    def _add_coalesced_side_effect(self, deadline, coalesced_side_effect):
+        self.coalesced_runs.add(
+            (
+                coalesced_side_effect.registered_side_effect.callable,
+                coalesced_side_effect.coalesce_key,
+            ),
+            deadline,
+            coalesced_side_effect._replace(coalesced_at=timezone.now()),
+        )
+
+    def _run_coalesced_side_effect(self, coalesced_side_effect):
+        with routers.read_after_write(), causing_event(coalesced_side_effect.event):
+            # Another process may have run it since, which covers this event.
+            last_run_at = self._get_last_run_at(
+                coalesced_side_effect.registered_side_effect,
+                coalesced_side_effect.coalesce_key,
+            )
+            if last_run_at and last_run_at > coalesced_side_effect.coalesced_at:
+                return
+
+            self._run_side_effect(
+                coalesced_side_effect.handler_log,
+                coalesced_side_effect.registered_side_effect,
+                coalesced_side_effect.result,
+                coalesced_side_effect.coalesce_key,
+            )
+
+    def run_coalesced_side_effects(self, force=False):
+        """Runs the side effects coalesced in windows that have closed.
+
+        This happens in the background as windows close, but can be called with
+        `force` on shutdown so pending runs aren't lost. Returns how many ran.
+        """
+        return self.coalesced_runs.run_due(force=force)
+
+    def _get_coalesce_key(self, registered_side_effect, event):
+        # Namespaced by the side effect, as logs only hold its unqualified name,
+        # and hashed when it wouldn't fit in the column.
+        callable = registered_side_effect.callable
+        coalesce_key = "{}.{}:{}".format(
+            callable.__module__,
+            callable.__qualname__,
+            registered_side_effect.coalesce_key(event),
+        )
+        max_length = EventSideEffectLog._meta.get_field("coalesce_key").max_length
+        if len(coalesce_key) > max_length:
+            coalesce_key = "sha256:" + hashlib.sha256(coalesce_key.encode()).hexdigest()
+        return coalesce_key
+
+    def _get_last_run_at(self, registered_side_effect, coalesce_key):
+        return (
+            EventSideEffectLog.objects.filter(
+                name=registered_side_effect.callable.__name__,
+                coalesce_key=coalesce_key,
+                status__in=[
+                    EventSideEffectLog.Status.PROCESSING,
+                    EventSideEffectLog.Status.SUCCESS,
+                ],
+                created_at__gt=timezone.now() - registered_side_effect.coalesce_window,
+            )
+            .order_by("-created_at")
+            .values_list("created_at", flat=True)
+            .first()
+        )
+
+    def handle_many(
+        self, events, skip_side_effects=False, atomic=False, batch_size=1000
+    ):
+        """Handles events in batches, hydrating each batch's references together.
 
-                if should_run:
-                    self._run_event_function(
-                        side_effect_log, registered_side_effect.callable, result
+        When `atomic`, all of the events are group committed in one transaction.
+        """
+        events = iter(events)
+        with _atomic(atomic):
+            while batch := list(itertools.islice(events, batch_size)):
+                for event in hydrate_events(batch):
+                    self.handle(
+                        event, skip_side_effects=skip_side_effects, atomic=atomic
                     )
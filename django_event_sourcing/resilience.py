@@ -0,0 +1,170 @@
+import concurrent.futures
+import contextvars
+import itertools
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class DaemonThreadPool:
+    """Runs calls on up to `max_workers` daemon threads.
+
+    Unlike `ThreadPoolExecutor`, its threads don't hold up the interpreter
+    exiting while a call that timed out is still running. Threads running
+    abandoned calls are replaced, and exit once their call returns.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.work = queue.SimpleQueue()
+        self.idle = threading.Semaphore(0)
+        self.threads = []
+        self.running = {}
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+
+    def submit(self, function, *args, **kwargs):
+        future = concurrent.futures.Future()
+        self.work.put((future, function, args, kwargs))
+
+        if not self.idle.acquire(blocking=False):
+            with self.lock:
+                if len(self.threads) < self.max_workers:
+                    self._start_thread()
+
+        return future
+
+    def abandon(self, future):
+        """Stops counting the thread running `future` towards `max_workers`."""
+        with self.lock:
+            thread = self.running.pop(future, None)
+            if thread is not None:
+                self.threads.remove(thread)
+                self._start_thread()
+
+    def _start_thread(self):
+        thread = threading.Thread(
+            target=self._work,
+            name=f"call-with-timeout-{next(self.counter)}",
+            daemon=True,
+        )
+        thread.start()
+        self.threads.append(thread)
+
+    def _work(self):
+        while True:
+            future, function, args, kwargs = self.work.get()
+            with self.lock:
+                if future.set_running_or_notify_cancel():
+                    self.running[future] = threading.current_thread()
+                else:
+                    future = None
+
+            if future is not None:
+                try:
+                    result = function(*args, **kwargs)
+                except BaseException as error:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+                with self.lock:
+                    if self.running.pop(future, None) is None:
+                        return  # Abandoned, and already replaced.
+
+            self.idle.release()
+
+
+def get_pool():
+    """Returns the pool shared by calls with a timeout.
+
+    Its size is `settings.EVENT_TIMEOUT_WORKERS`, defaulting to 10.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = DaemonThreadPool(getattr(settings, "EVENT_TIMEOUT_WORKERS", 10))
+    return _pool
+
+
+def call_with_timeout(function, timeout, *args, **kwargs):
+    """Calls a function, raising `TimeoutError` if it takes over `timeout` seconds.
+
+    The function runs on a shared pool of worker threads with the caller's
+    context variables, such as `read_after_write()`. It has its own database
+    connection, so its queries are outside any transaction of the caller, and
+    it carries on in the background after timing out. Time spent waiting for
+    a free worker counts towards the timeout.
+    """
+    future = get_pool().submit(
+        contextvars.copy_context().run,
+        _call_and_close_connections,
+        function,
+        *args,
+        **kwargs,
+    )
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        # So it doesn't run later if it's still waiting for a worker, or hold
+        # one up if it's hung.
+        if not future.cancel():
+            get_pool().abandon(future)
+        raise TimeoutError(f"{function.__name__} timed out after {timeout} seconds.")
+
+
+def _call_and_close_connections(function, *args, **kwargs):
+    try:
+        return function(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+class CircuitBreaker:
+    """Stops calls after consecutive failures, probing again after a cool down.
+
+    Once `failure_threshold` calls in a row have failed, `allow()` is false until
+    `reset_timeout` seconds have passed. Then a single call is allowed through,
+    closing the circuit if it succeeds and opening it again if it fails.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Restarts the cool down so only this call probes.
+                self.opened_at = time.monotonic()
+                return True
+
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
@@ -0,0 +1,105 @@
+import contextlib
+import contextvars
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+APP_LABEL = "django_event_sourcing"
+
+_read_after_write = contextvars.ContextVar("read_after_write", default=False)
+
+
+def get_database(role):
+    """Returns the alias configured for "events", "logs" or "replica".
+
+    Configured with `settings.EVENT_SOURCING_DATABASES`, falling back to the
+    default database, and to the events database for the replica.
+    """
+    databases = getattr(settings, "EVENT_SOURCING_DATABASES", {})
+    if role == "replica":
+        return databases.get("replica") or get_database("events")
+    return databases.get(role, DEFAULT_DB_ALIAS)
+
+
+def spans_databases():
+    """Whether events or their logs are routed away from the default database."""
+    return {get_database("events"), get_database("logs")} != {DEFAULT_DB_ALIAS}
+
+
+def get_database_for(model, alias):
+    """Returns `alias`, or the database `model` is routed to if it isn't there."""
+    if model._meta.model_name == "event":
+        aliases = (get_database("events"), get_database("replica"))
+    else:
+        aliases = (get_database("logs"),)
+    return alias if alias in aliases else aliases[0]
+
+
+@contextlib.contextmanager
+def read_after_write():
+    """Reads events from the primary, so writes made just before are seen."""
+    token = _read_after_write.set(True)
+    try:
+        yield
+    finally:
+        _read_after_write.reset(token)
+
+
+def _get_atomic_databases():
+    return dict.fromkeys(
+        [DEFAULT_DB_ALIAS, get_database("events"), get_database("logs")]
+    )
+
+
+@contextlib.contextmanager
+def atomic():
+    """A transaction, or savepoint, on the default, events and logs databases."""
+    with contextlib.ExitStack() as stack:
+        for alias in _get_atomic_databases():
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+def in_atomic_block():
+    """Whether the default, events or logs database is inside a transaction."""
+    return any(
+        transaction.get_connection(alias).in_atomic_block
+        for alias in _get_atomic_databases()
+    )
+
+
+class EventSourcingRouter:
+    """Routes events and their logs to the databases in `EVENT_SOURCING_DATABASES`.
+
+    Event reads go to the replica unless inside `read_after_write()`.
+    """
+
+    def _get_role(self, model):
+        if model._meta.app_label != APP_LABEL:
+            return None
+        return "events" if model._meta.model_name == "event" else "logs"
+
+    def db_for_read(self, model, **hints):
+        role = self._get_role(model)
+        if role == "events" and not _read_after_write.get():
+            return get_database("replica")
+        return role and get_database(role)
+
+    def db_for_write(self, model, **hints):
+        role = self._get_role(model)
+        return role and get_database(role)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Relations between the event tables, and to users, only have database
+        # constraints when they aren't routed to separate databases.
+        if APP_LABEL in (obj1._meta.app_label, obj2._meta.app_label):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label != APP_LABEL or not hasattr(settings, "EVENT_SOURCING_DATABASES"):
+            return None
+
+        if model_name is None:
+            return db in (get_database("events"), get_database("logs"))
+        return db == get_database("events" if model_name == "event" else "logs")
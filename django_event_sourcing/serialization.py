@@ -0,0 +1,139 @@
+import csv
+import gzip
+import io
+import json
+import uuid
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, router, transaction
+
+from .models import Event, LazyPayload, ModelJSONEncoder, PayloadField
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSION_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def open_compressed(file, mode="r", compression="gzip"):
+    """Opens a text stream over a gzip or zstd compressed file or path."""
+    if compression == "gzip":
+        return gzip.open(file, mode + "t", encoding="utf-8")
+
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImproperlyConfigured(
+                "zstd compression requires the zstandard package to be installed."
+            )
+        return zstandard.open(file, mode + "t", encoding="utf-8")
+
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def instance_to_record(instance):
+    """Converts a model instance into a JSON serialisable dictionary."""
+    record = {}
+    for field in instance._meta.concrete_fields:
+        value = field.value_from_object(instance)
+        record[field.attname] = (
+            None if value is None else field.value_to_string(instance)
+        )
+    return record
+
+
+def record_to_instance(model, record):
+    """Builds an unsaved model instance from a record."""
+    values = {}
+    for field in model._meta.concrete_fields:
+        if field.attname not in record:
+            continue
+
+        value = record[field.attname]
+        if value is None:
+            values[field.attname] = None
+        elif isinstance(field, PayloadField):
+            # Decoded on access like a loaded row, so older versions are upcast.
+            values[field.attname] = LazyPayload(value, field.decoder)
+        else:
+            values[field.attname] = field.to_python(value)
+
+    return model(**values)
+
+
+def write_events(events, file):
+    """Writes events to a text stream as JSON lines and returns how many."""
+    count = 0
+    for event in events:
+        file.write(json.dumps(instance_to_record(event), cls=ModelJSONEncoder) + "\n")
+        count += 1
+    return count
+
+
+def read_events(file):
+    """Yields unsaved events from a text stream of JSON lines."""
+    for line in file:
+        if line.strip():
+            yield record_to_instance(Event, json.loads(line))
+
+
+def insert_events(events, using=None):
+    """Inserts events exactly as given, skipping any that already exist.
+
+    Uses COPY on PostgreSQL and multi-row INSERTs on other databases. Like
+    `loaddata`, values such as `created_at` are kept rather than regenerated.
+    """
+    using = using or router.db_for_write(Event)
+    connection = connections[using]
+    fields = Event._meta.concrete_fields
+
+    if connection.vendor == "postgresql":
+        _copy_events(events, fields, connection)
+        return
+
+    batch_size = max(connection.ops.bulk_batch_size(fields, events), 1)
+    for i in range(0, len(events), batch_size):
+        Event.objects._insert(
+            events[i : i + batch_size],
+            fields,
+            raw=True,
+            using=using,
+            ignore_conflicts=True,
+        )
+
+
+def _copy_events(events, fields, connection):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for event in events:
+        writer.writerow(
+            [
+                field.get_db_prep_save(getattr(event, field.attname), connection)
+                for field in fields
+            ]
+        )
+    buffer.seek(0)
+
+    quote_name = connection.ops.quote_name
+    table = quote_name(Event._meta.db_table)
+    # Unique, as tables dropped on commit outlive savepoints in the same transaction.
+    temporary_table = quote_name(f"import_events_{uuid.uuid4().hex}")
+    columns = ", ".join(quote_name(field.column) for field in fields)
+
+    # COPY can't skip conflicting rows, so it goes through a temporary table.
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {temporary_table} "
+            f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"
+        )
+        cursor.copy_expert(
+            f"COPY {temporary_table} ({columns}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) SELECT {columns} "
+            f"FROM {temporary_table} ON CONFLICT DO NOTHING"
+        )
+        cursor.execute(f"DROP TABLE {temporary_table}")
@@ -0,0 +1,8 @@
+from django_event_sourcing.globals import get_event_handler_register
+
+from .event_types import DummyEventType
+
+
+@get_event_handler_register().register(event_type=DummyEventType.TEST_ANOTHER)
+def autodiscovered_handler(event):
+    pass
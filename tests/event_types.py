@@ -7,3 +7,6 @@ class DummyEventType(EventType):
 
     def get_namespace(self):
         return "dummy"
+
+    def get_model_references(self):
+        return {"user": "auth.User", "users": "auth.User"}
@@ -2,15 +2,31 @@ INSTALLED_APPS = [
     "django_event_sourcing",
     "django.contrib.auth",
     "django.contrib.contenttypes",
+    "tests",
 ]
 
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": ":memory:",
-    }
+    },
+    # Only used when tests set EVENT_SOURCING_DATABASES to route to them.
+    "events": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+    },
+    "logs": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+    },
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+    },
 }
 
+DATABASE_ROUTERS = ["django_event_sourcing.routers.EventSourcingRouter"]
+
 SECRET_KEY = "This is a SECRET_KEY"
 
 EVENT_TYPES = [
@@ -0,0 +1,161 @@
+from datetime import datetime
+import os
+
+from django.core.management import call_command
+from django_event_sourcing.archive import EventArchive
+from django_event_sourcing.models import Event, EventHandlerLog, EventSideEffectLog
+from django_event_sourcing.registers import EventHandlerRegister
+from freezegun import freeze_time
+import pytest
+
+from .event_types import DummyEventType
+
+
+def archived_handler(event):
+    pass
+
+
+@pytest.fixture
+def archive_root(settings, tmp_path):
+    settings.EVENT_ARCHIVE_ROOT = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def old_event(admin_user):
+    with freeze_time("2019-01-01"):
+        event = Event.objects.create(
+            type=DummyEventType.TEST, data={"message": "old"}, created_by=admin_user
+        )
+        event.handler_logs.create_from_function(
+            function=archived_handler, status=EventHandlerLog.Status.SUCCESS
+        )
+        return event
+
+
+@pytest.fixture
+def new_event(admin_user):
+    with freeze_time("2021-01-01"):
+        return Event.objects.create(
+            type=DummyEventType.TEST_ANOTHER,
+            data={"message": "new"},
+            created_by=admin_user,
+        )
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_archives_old_events(archive_root, old_event, new_event, compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+
+    call_command("archive_events", "--before=2020-01-01", compression=compression)
+
+    assert list(Event.objects.all()) == [new_event]
+    assert not EventHandlerLog.objects.exists()
+
+    [index] = EventArchive().indexes()
+    assert index["compression"] == compression
+    assert index["ids"] == [str(old_event.pk)]
+    assert (archive_root / index["segment"]).exists()
+
+
+class TestEventArchive:
+    def test_get(self, archive_root, old_event):
+        archive = EventArchive()
+        archive.write_segment([old_event])
+
+        event = EventArchive().get(old_event.pk)
+        assert event.pk == old_event.pk
+        assert event.type == DummyEventType.TEST
+        assert event.data == {"message": "old"}
+        assert event.created_at == datetime(2019, 1, 1)
+        assert event.created_by_id == old_event.created_by_id
+        assert event.archived
+
+    def test_get_reuses_cached_indexes(self, archive_root, old_event, mocker):
+        EventArchive().write_segment([old_event])
+        os.utime(archive_root, (0, 0))
+        EventArchive().indexes()
+
+        glob = mocker.spy(type(archive_root), "glob")
+        assert EventArchive().get(old_event.pk).pk == old_event.pk
+        glob.assert_not_called()
+
+    def test_get_missing(self, archive_root, old_event):
+        with pytest.raises(Event.DoesNotExist):
+            EventArchive().get(old_event.pk)
+
+    def test_iterate_filters(self, archive_root, old_event, new_event):
+        EventArchive().write_segment([new_event, old_event])
+
+        assert [event.pk for event in EventArchive().iterate()] == [
+            old_event.pk,
+            new_event.pk,
+        ]
+        assert [
+            event.pk for event in EventArchive().iterate(start=datetime(2020, 1, 1))
+        ] == [new_event.pk]
+        assert [
+            event.pk for event in EventArchive().iterate(types=[DummyEventType.TEST])
+        ] == [old_event.pk]
+
+
+class TestEventManagerReadThrough:
+    def test_get_including_archived(self, archive_root, old_event):
+        call_command("archive_events", "--before=2020-01-01")
+
+        assert Event.objects.get_including_archived(old_event.pk).pk == old_event.pk
+
+    def test_get_including_archived_without_archive(self, old_event):
+        assert Event.objects.get_including_archived(old_event.pk) == old_event
+
+    def test_iterate_including_archived(self, archive_root, old_event, new_event):
+        call_command("archive_events", "--before=2020-01-01")
+
+        assert [event.pk for event in Event.objects.iterate_including_archived()] == [
+            old_event.pk,
+            new_event.pk,
+        ]
+
+
+class TestReplayingArchivedEvents:
+    @pytest.fixture
+    def event_handlers(self, mocker):
+        event_handlers = EventHandlerRegister()
+        mocker.patch(
+            "django_event_sourcing.models.get_event_handler_register",
+            return_value=event_handlers,
+        )
+        return event_handlers
+
+    @pytest.fixture
+    def handler(self, event_handlers, mocker):
+        handler = mocker.Mock(__name__="handler", return_value="result")
+        side_effect = mocker.Mock(__name__="side_effect")
+        event_handlers.register(
+            event_type=[DummyEventType.TEST, DummyEventType.TEST_ANOTHER]
+        )(event_handlers.register_side_effect(side_effect)(handler))
+        return handler
+
+    def test_replays_archived_events(
+        self, archive_root, old_event, new_event, event_handlers, handler
+    ):
+        call_command("archive_events", "--before=2020-01-01")
+
+        event_handlers.handle_many(Event.objects.iterate_including_archived())
+
+        assert [call.args[0].pk for call in handler.call_args_list] == [
+            old_event.pk,
+            new_event.pk,
+        ]
+        assert EventHandlerLog.objects.get().event == new_event
+        assert EventSideEffectLog.objects.count() == 1
+
+    def test_handles_archived_event(self, archive_root, old_event, handler):
+        call_command("archive_events", "--before=2020-01-01")
+
+        [handler_log] = Event.objects.get_including_archived(old_event.pk).handle()
+
+        assert handler_log.status == EventHandlerLog.Status.SUCCESS
+        assert handler_log.archived
+        assert not EventHandlerLog.objects.exists()
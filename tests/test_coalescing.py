@@ -0,0 +1,36 @@
+from datetime import timedelta
+import threading
+
+from django.utils import timezone
+from django_event_sourcing.coalescing import CoalescedRuns
+
+
+class TestCoalescedRuns:
+    def test_runs_latest_value(self, mocker):
+        run = mocker.Mock()
+        coalesced_runs = CoalescedRuns(run, background=False)
+
+        coalesced_runs.add("key", timezone.now(), 1)
+        coalesced_runs.add("key", timezone.now() + timedelta(minutes=1), 2)
+
+        assert coalesced_runs.run_due() == 1
+        run.assert_called_once_with(2)
+
+    def test_waits_for_deadline(self, mocker):
+        run = mocker.Mock()
+        coalesced_runs = CoalescedRuns(run, background=False)
+
+        coalesced_runs.add("key", timezone.now() + timedelta(minutes=1), 1)
+
+        assert coalesced_runs.run_due() == 0
+        assert coalesced_runs.run_due(force=True) == 1
+        run.assert_called_once_with(1)
+
+    def test_runs_in_background(self):
+        ran = threading.Event()
+        coalesced_runs = CoalescedRuns(lambda value: ran.set())
+
+        coalesced_runs.add("key", timezone.now() + timedelta(milliseconds=50), 1)
+
+        assert ran.wait(timeout=5)
+        assert coalesced_runs.thread.daemon
@@ -0,0 +1,57 @@
+from django.contrib.auth.models import User
+from django_event_sourcing.hydration import hydrate_events
+from django_event_sourcing.models import Event
+import pytest
+
+from .event_types import DummyEventType
+
+
+@pytest.fixture
+def users(db):
+    return [User.objects.create(username=f"user{i}") for i in range(3)]
+
+
+@pytest.fixture
+def events(users):
+    return [
+        Event.objects.create(
+            type=DummyEventType.TEST,
+            data={"user": user, "users": users, "message": "test"},
+            created_by=user,
+        )
+        for user in users
+    ]
+
+
+def test_hydrates_references_with_one_query(users, events, django_assert_num_queries):
+    events = list(Event.objects.filter(pk__in=[event.pk for event in events]))
+
+    with django_assert_num_queries(1):
+        hydrate_events(events)
+        for event in events:
+            assert event.created_by in users
+            assert event.references["user"] == event.created_by
+            assert event.references["users"] == users
+            assert event.data["user"] == event.created_by.pk
+
+
+def test_missing_references_are_none(users, events):
+    event = Event.objects.get(pk=events[0].pk)
+    event.data["user"] = 1000
+    event.save()
+
+    hydrate_events([event])
+    assert event.references["user"] is None
+
+    event.save()
+    event.refresh_from_db()
+    assert event.data["user"] == 1000
+
+
+def test_handles_events_without_references(admin_user):
+    event = Event.objects.create(
+        type=DummyEventType.TEST, data={}, created_by=admin_user
+    )
+    hydrate_events([event])
+    assert event.data == {}
+    assert event.references == {}
@@ -1,12 +1,21 @@
 from datetime import datetime
+import json
 import uuid
 
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
 from django_event_sourcing.globals import get_event_handler_register
 from django_event_sourcing.models import (
     Event,
     EventHandlerLog,
     EventType,
     EventTypeField,
+    LazyPayload,
+)
+from django_event_sourcing.registers import (
+    EventHandlerRegister,
+    EventUpcasterRegister,
 )
 from freezegun import freeze_time
 import pytest
@@ -99,6 +108,249 @@ class TestEvent:
         )
         mock_event_handler_for_test.assert_called_once_with(event)
 
+    def test_create_and_handle_atomic(self, admin_user, mock_event_handler_for_test):
+        event, _ = Event.objects.create_and_handle(
+            type=DummyEventType.TEST, data={}, created_by=admin_user, atomic=True
+        )
+        mock_event_handler_for_test.assert_called_once_with(event)
+        assert {log.status for log in event.handler_logs.all()} == {
+            EventHandlerLog.Status.SUCCESS
+        }
+
+    def test_create_and_handle_with_idempotency_key(
+        self, admin_user, mock_event_handler_for_test
+    ):
+        event, handler_logs = Event.objects.create_and_handle(
+            type=DummyEventType.TEST,
+            data={},
+            created_by=admin_user,
+            idempotency_key="request-1",
+        )
+        assert event.created_at
+        mock_event_handler_for_test.assert_called_once_with(event)
+
+        duplicate, duplicate_handler_logs = Event.objects.create_and_handle(
+            type=DummyEventType.TEST,
+            data={},
+            created_by=admin_user,
+            idempotency_key="request-1",
+        )
+        assert duplicate == event
+        assert set(duplicate_handler_logs) == set(handler_logs)
+        mock_event_handler_for_test.assert_called_once_with(event)
+        assert Event.objects.count() == 1
+
+    def test_idempotent_insert_is_one_query(
+        self, admin_user, django_assert_num_queries
+    ):
+        event = Event(
+            type=DummyEventType.TEST,
+            data={},
+            created_by=admin_user,
+            idempotency_key="request-1",
+        )
+        with django_assert_num_queries(1):
+            assert Event.objects._insert_unless_exists(event)
+
+    def test_create_and_handle_many(self, admin_user, mock_event_handler_for_test):
+        results = Event.objects.create_and_handle_many(
+            [
+                {"type": DummyEventType.TEST, "data": {}, "created_by": admin_user},
+                {"type": DummyEventType.TEST, "data": {}, "created_by": admin_user},
+            ]
+        )
+        assert mock_event_handler_for_test.call_count == 2
+        assert [event for event, _ in results] == list(
+            Event.objects.order_by("created_at")
+        )
+
+
+class TestPayloadField:
+    def test_decodes_lazily(self, event):
+        event.data = {"message": "test"}
+        event.save()
+
+        event = Event.objects.get(pk=event.pk)
+        assert isinstance(event.__dict__["data"], LazyPayload)
+        assert event.data == {"message": "test"}
+        assert event.__dict__["data"] == {"message": "test"}
+
+    def test_saves_undecoded_payload(self, event):
+        event.data = {"message": "test"}
+        event.save()
+
+        event = Event.objects.get(pk=event.pk)
+        event.save()
+        event.refresh_from_db()
+        assert event.data == {"message": "test"}
+
+    def test_compresses_large_payloads(self, event, settings):
+        settings.EVENT_DATA_COMPRESSION_THRESHOLD = 100
+        event.data = {"message": "test" * 100}
+        event.save()
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT data FROM {Event._meta.db_table} WHERE id = %s",
+                [event.pk.hex],
+            )
+            [stored] = cursor.fetchone()
+        assert "$zlib" in stored
+        assert Event.objects.values_list("data", flat=True).get(pk=event.pk) == {
+            "message": "test" * 100
+        }
+
+        event.refresh_from_db()
+        assert event.data == {"message": "test" * 100}
+
+    def test_does_not_compress_small_payloads(self, event, settings):
+        settings.EVENT_DATA_COMPRESSION_THRESHOLD = 100
+        event.data = {"message": "test"}
+        event.save()
+
+        assert Event.objects.filter(data__message="test").exists()
+
+    def test_values_are_decoded(self, event):
+        event.data = {"message": "test"}
+        event.save()
+
+        [values] = Event.objects.filter(pk=event.pk).values("id", "data")
+        assert values == {"id": event.pk, "data": {"message": "test"}}
+        assert json.dumps(values, cls=DjangoJSONEncoder)
+
+        [row] = Event.objects.filter(pk=event.pk).values_list("data", named=True)
+        assert row._fields == ("data",)
+        assert row.data == {"message": "test"}
+
+    def test_values_select_only_given_fields(self, event, admin_user):
+        event.data = {"message": "test"}
+        event.save()
+        Event.objects.create(
+            type=DummyEventType.TEST_ANOTHER,
+            data={"message": "test"},
+            created_by=admin_user,
+        )
+
+        assert list(Event.objects.values("data").distinct()) == [
+            {"data": {"message": "test"}}
+        ]
+
+    def test_without_data(self, event):
+        event = Event.objects.without_data().get(pk=event.pk)
+        assert "data" in event.get_deferred_fields()
+        assert event.data == {}
+
+
+class TestEventUpcasting:
+    @pytest.fixture(autouse=True)
+    def upcasters(self, mocker):
+        upcasters = EventUpcasterRegister()
+        mocker.patch(
+            "django_event_sourcing.models.get_event_upcaster_register",
+            return_value=upcasters,
+        )
+
+        @upcasters.register(event_type=DummyEventType.TEST, version=1)
+        def rename_message(data):
+            return {"text": data["message"]}
+
+        return upcasters
+
+    @pytest.fixture
+    def old_event(self, event, mocker):
+        Event.objects.filter(pk=event.pk).update(data={"message": "test"})
+        mocker.patch.object(DummyEventType, "get_version", return_value=2)
+        return event
+
+    def test_new_events_have_latest_version(self, admin_user, mocker):
+        mocker.patch.object(DummyEventType, "get_version", return_value=2)
+        event = Event.objects.create(
+            type=DummyEventType.TEST, data={}, created_by=admin_user
+        )
+        assert event.data_version == 2
+
+    def test_upcasts_on_read(self, old_event):
+        event = Event.objects.get(pk=old_event.pk)
+        assert event.data_version == 1
+        assert event.data == {"text": "test"}
+        assert event.data_version == 2
+
+    def test_upcasts_values(self, old_event):
+        assert list(Event.objects.values_list("data", flat=True)) == [
+            {"message": "test"}
+        ]
+        assert list(Event.objects.values("type", "data", "data_version")) == [
+            {"type": DummyEventType.TEST, "data": {"text": "test"}, "data_version": 2}
+        ]
+
+    def test_upcast_events_command(self, old_event, admin_user):
+        current_event = Event.objects.create(
+            type=DummyEventType.TEST, data={"text": "current"}, created_by=admin_user
+        )
+
+        call_command("upcast_events", batch_size=1)
+
+        assert Event.objects.filter(data_version=1).count() == 0
+        assert Event.objects.get(pk=old_event.pk).data == {"text": "test"}
+        assert Event.objects.get(pk=current_event.pk).data == {"text": "current"}
+
+
+class TestEventLineage:
+    @pytest.fixture
+    def event_handlers(self, mocker):
+        event_handlers = EventHandlerRegister()
+        mocker.patch(
+            "django_event_sourcing.models.get_event_handler_register",
+            return_value=event_handlers,
+        )
+
+        @event_handlers.register(event_type=DummyEventType.TEST)
+        def create_child(event):
+            Event.objects.create_and_handle(
+                type=DummyEventType.TEST_ANOTHER, data={}, created_by=event.created_by
+            )
+
+        @event_handlers.register(event_type=DummyEventType.TEST_ANOTHER)
+        def create_leaf(event):
+            if not event.data.get("leaf"):
+                Event.objects.create(
+                    type=DummyEventType.TEST_ANOTHER,
+                    data={"leaf": True},
+                    created_by=event.created_by,
+                )
+
+        return event_handlers
+
+    @pytest.fixture
+    def root(self, admin_user, event_handlers):
+        Event.objects.create(type=DummyEventType.TEST, data={}, created_by=admin_user)
+        root, _ = Event.objects.create_and_handle(
+            type=DummyEventType.TEST, data={}, created_by=admin_user
+        )
+        return root
+
+    def test_sets_causation_and_correlation(self, root):
+        child = Event.objects.get(causation_id=root.pk)
+        leaf = Event.objects.get(causation_id=child.pk)
+
+        assert root.causation_id is None
+        assert root.correlation_id == root.pk
+        assert child.correlation_id == root.pk
+        assert leaf.correlation_id == root.pk
+
+    def test_get_causal_tree(self, root, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            tree = Event.objects.get_causal_tree(root)
+
+        assert [event.pk for event in tree] == list(
+            Event.objects.correlated_with(root)
+            .order_by("created_at")
+            .values_list("pk", flat=True)
+        )
+        assert len(tree) == 3
+        assert tree[0] == root
+        assert tree[2].data == {"leaf": True}
+
 
 @freeze_time("2020-01-01")
 class TestEventHandlerLog:
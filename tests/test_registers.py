@@ -1,9 +1,23 @@
+from datetime import timedelta
+import time
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
 from django_event_sourcing.conditions import Condition
+from django_event_sourcing.globals import (
+    get_event_handler_register,
+    get_event_type_register,
+)
 from django_event_sourcing.models import Event, EventHandlerLog, EventSideEffectLog
 from django_event_sourcing.registers import (
     EventHandlerRegister,
     EventTypeRegister,
+    EventUpcasterRegister,
 )
+from django_event_sourcing.resilience import CircuitBreaker
+from freezegun import freeze_time
+import pytest
 
 from .event_types import DummyEventType
 
@@ -13,8 +27,70 @@ class TestEventTypeRegister:
         register = EventTypeRegister(settings.EVENT_TYPES)
         assert register["dummy.test"] == DummyEventType.TEST
 
+    def test_frozen_at_startup(self):
+        register = get_event_type_register()
+        assert register.frozen
+
+        with pytest.raises(TypeError):
+            register["dummy.other"] = DummyEventType.TEST
+
+
+class TestEventUpcasterRegister:
+    def test_upcast_chains_versions(self, mocker):
+        mocker.patch.object(DummyEventType, "get_version", return_value=3)
+        upcasters = EventUpcasterRegister()
+
+        @upcasters.register(event_type=DummyEventType.TEST, version=1)
+        def rename_message(data):
+            return {"text": data["message"]}
+
+        @upcasters.register(event_type=DummyEventType.TEST, version=2)
+        def add_author(data):
+            return {**data, "author": None}
+
+        assert upcasters.upcast(DummyEventType.TEST, 1, {"message": "test"}) == {
+            "text": "test",
+            "author": None,
+        }
+        assert upcasters.upcast(DummyEventType.TEST, 2, {"text": "test"}) == {
+            "text": "test",
+            "author": None,
+        }
+
+    def test_caches_chains(self, mocker):
+        mocker.patch.object(DummyEventType, "get_version", return_value=2)
+        upcasters = EventUpcasterRegister()
+        upcasters.register(event_type=DummyEventType.TEST, version=1)(dict)
+
+        chain = upcasters.get_chain(DummyEventType.TEST, 1)
+        assert upcasters.get_chain(DummyEventType.TEST, 1) is chain
+
+    def test_missing_upcaster(self, mocker):
+        mocker.patch.object(DummyEventType, "get_version", return_value=2)
+
+        with pytest.raises(ImproperlyConfigured):
+            EventUpcasterRegister().upcast(DummyEventType.TEST, 1, {})
+
 
 class TestEventHandlerRegister:
+    def test_autodiscovers_handlers_at_startup(self):
+        from .event_handlers import autodiscovered_handler
+
+        register = get_event_handler_register()
+        assert register.frozen
+        assert autodiscovered_handler in register.handlers[DummyEventType.TEST_ANOTHER]
+
+    def test_registering_when_frozen_warns(self, caplog):
+        event_handlers = EventHandlerRegister()
+        event_handlers.freeze()
+
+        @event_handlers.register(event_type=DummyEventType.TEST)
+        def handler(event):
+            pass
+
+        assert event_handlers.handlers[DummyEventType.TEST] == (handler,)
+        assert "after the event handler register was frozen" in caplog.text
+
     def test_handle(self, admin_user, mocker):
         event_handlers = EventHandlerRegister()
         mock = mocker.Mock()
@@ -182,3 +258,289 @@ class TestEventHandlerRegister:
 
         side_effect_log = log.side_effect_logs.get()
         assert side_effect_log.status == EventSideEffectLog.Status.SKIPPED
+
+    def test_handle_many_hydrates_references(
+        self, admin_user, mocker, django_assert_num_queries
+    ):
+        event_handlers = EventHandlerRegister()
+        mock = mocker.Mock()
+
+        @event_handlers.register(event_type=DummyEventType.TEST)
+        def handler(event):
+            mock(event.references["user"])
+
+        for _ in range(3):
+            Event.objects.create(
+                type=DummyEventType.TEST,
+                data={"user": admin_user},
+                created_by=admin_user,
+            )
+
+        # One query for the events, one for the users and two log writes per event.
+        with django_assert_num_queries(2 + 3 * 2):
+            event_handlers.handle_many(Event.objects.all())
+
+        mock.assert_has_calls([mocker.call(admin_user)] * 3)
+
+    def test_atomic_rolls_back_failing_handler(self, admin_user):
+        event_handlers = EventHandlerRegister()
+
+        @event_handlers.register(event_type=DummyEventType.TEST)
+        def failing_handler(event):
+            User.objects.create(username="failing")
+            raise Exception("Help im erroring")
+
+        @event_handlers.register(event_type=DummyEventType.TEST)
+        def handler(event):
+            User.objects.create(username="succeeding")
+
+        event = Event.objects.create(
+            type=DummyEventType.TEST, data={}, created_by=admin_user
+        )
+
+        event_handlers.handle(event, atomic=True)
+
+        assert not User.objects.filter(username="failing").exists()
+        assert User.objects.filter(username="succeeding").exists()
+        assert {log.name: log.status for log in event.handler_logs.all()} == {
+            "failing_handler": EventHandlerLog.Status.FAILED,
+            "handler": EventHandlerLog.Status.SUCCESS,
+        }
+
+    @pytest.fixture
+    def coalescing_handlers(self, mocker):
+        # Runs on commit callbacks straight away, as tests never commit.
+        mocker.patch(
+            "django_event_sourcing.registers.transaction.on_commit",
+            side_effect=lambda function, using=None: function(),
+        )
+        event_handlers = EventHandlerRegister()
+        event_handlers.coalesced_runs.background = False
+        return event_handlers
+
+    def test_coalesces_side_effects(self, admin_user, mocker, coalescing_handlers):
+        side_effect_mock = mocker.Mock()
+
+        def side_effect(result):
+            return side_effect_mock(result)
+
+        @coalescing_handlers.register(event_type=DummyEventType.TEST)
+        @coalescing_handlers.register_side_effect(
+            side_effect,
+            coalesce_key=lambda event: event.data["entity"],
+            coalesce_window=timedelta(minutes=1),
+        )
+        def handler(event):
+            return event.data["entity"], event.data["count"]
+
+        def handle(entity, count):
+            event = Event.objects.create(
+                type=DummyEventType.TEST,
+                data={"entity": entity, "count": count},
+                created_by=admin_user,
+            )
+            coalescing_handlers.handle(event)
+            return event.handler_logs.get().side_effect_logs.get()
+
+        with freeze_time("2020-01-01 00:00:00"):
+            assert handle("a", 1).status == EventSideEffectLog.Status.SUCCESS
+            assert handle("a", 2).status == EventSideEffectLog.Status.COALESCED
+            assert handle("b", 1).status == EventSideEffectLog.Status.SUCCESS
+
+        with freeze_time("2020-01-01 00:00:30"):
+            assert handle("a", 3).status == EventSideEffectLog.Status.COALESCED
+            assert coalescing_handlers.run_coalesced_side_effects() == 0
+
+        with freeze_time("2020-01-01 00:01:00"):
+            assert coalescing_handlers.run_coalesced_side_effects() == 1
+
+        with freeze_time("2020-01-01 00:01:30"):
+            assert handle("a", 4).status == EventSideEffectLog.Status.COALESCED
+
+        with freeze_time("2020-01-01 00:02:00"):
+            assert coalescing_handlers.run_coalesced_side_effects() == 1
+
+        with freeze_time("2020-01-01 00:03:00"):
+            assert handle("a", 5).status == EventSideEffectLog.Status.SUCCESS
+
+        assert side_effect_mock.call_args_list == [
+            mocker.call(("a", 1)),
+            mocker.call(("b", 1)),
+            mocker.call(("a", 3)),
+            mocker.call(("a", 4)),
+            mocker.call(("a", 5)),
+        ]
+        assert (
+            EventSideEffectLog.objects.filter(
+                status=EventSideEffectLog.Status.SUCCESS
+            ).count()
+            == 5
+        )
+
+    def test_skips_coalesced_runs_made_elsewhere(
+        self, admin_user, mocker, coalescing_handlers
+    ):
+        side_effect_mock = mocker.Mock()
+
+        def side_effect(result):
+            return side_effect_mock(result)
+
+        @coalescing_handlers.register(event_type=DummyEventType.TEST)
+        @coalescing_handlers.register_side_effect(
+            side_effect,
+            coalesce_key=lambda event: "key",
+            coalesce_window=timedelta(minutes=1),
+        )
+        def handler(event):
+            return event.data
+
+        with freeze_time("2020-01-01 00:00:00"):
+            for _ in range(2):
+                event = Event.objects.create(
+                    type=DummyEventType.TEST, data={}, created_by=admin_user
+                )
+                coalescing_handlers.handle(event)
+            log = event.handler_logs.get().side_effect_logs.get()
+            assert log.status == EventSideEffectLog.Status.COALESCED
+
+        # Another process ran the side effect after this one coalesced it.
+        with freeze_time("2020-01-01 00:00:30"):
+            EventSideEffectLog.objects.create(
+                handler_log=log.handler_log,
+                name=log.name,
+                coalesce_key=log.coalesce_key,
+                status=EventSideEffectLog.Status.SUCCESS,
+            )
+
+        with freeze_time("2020-01-01 00:01:00"):
+            assert coalescing_handlers.run_coalesced_side_effects() == 1
+
+        assert side_effect_mock.call_count == 1
+
+    def test_hashes_long_coalesce_keys(self, admin_user, coalescing_handlers):
+        @coalescing_handlers.register(event_type=DummyEventType.TEST)
+        @coalescing_handlers.register_side_effect(
+            print,
+            coalesce_key=lambda event: "key" * 100,
+            coalesce_window=timedelta(minutes=1),
+        )
+        def handler(event):
+            pass
+
+        event = Event.objects.create(
+            type=DummyEventType.TEST, data={}, created_by=admin_user
+        )
+        coalescing_handlers.handle(event)
+
+        log = event.handler_logs.get().side_effect_logs.get()
+        assert log.coalesce_key.startswith("sha256:")
+        assert len(log.coalesce_key) <= 255
+
+    def test_coalesce_key_requires_window(self):
+        with pytest.raises(TypeError):
+            EventHandlerRegister().register_side_effect(
+                print, coalesce_key=lambda event: event.pk
+            )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_handler_timeout(self, admin_user):
+        event_handlers = EventHandlerRegister()
+
+        @event_handlers.register(event_type=DummyEventType.TEST, timeout=0.01)
+        def handler(event):
+            time.sleep(0.5)
+
+        event = Event.objects.create(
+            type=DummyEventType.TEST, data={}, created_by=admin_user
+        )
+
+        event_handlers.handle(event)
+
+        log = event.handler_logs.get()
+        assert log.status == EventHandlerLog.Status.FAILED
+        assert "TimeoutError" in log.message
+
+    def test_handler_timeout_is_not_atomic(self, admin_user):
+        event_handlers = EventHandlerRegister()
+
+        @event_handlers.register(event_type=DummyEventType.TEST, timeout=1)
+        def handler(event):
+            pass
+
+        event = Event.objects.create(
+            type=DummyEventType.TEST, data={}, created_by=admin_user
+        )
+
+        with pytest.raises(ValueError):
+            event_handlers.handle(event, atomic=True)
+        assert not event.handler_logs.exists()
+
+    @pytest.mark.django_db(transaction=True)
+    def test_handler_timeout_is_not_in_a_transaction(self, admin_user):
+        event_handlers = EventHandlerRegister()
+
+        @event_handlers.register(event_type=DummyEventType.TEST, timeout=1)
+        def handler(event):
+            pass
+
+        event = Event.objects.create(
+            type=DummyEventType.TEST, data={}, created_by=admin_user
+        )
+
+        with transaction.atomic(), pytest.raises(ValueError):
+            event_handlers.handle(event)
+        assert not event.handler_logs.exists()
+
+    def test_side_effect_circuit_breaker(self, admin_user, mocker):
+        event_handlers = EventHandlerRegister()
+        side_effect_mock = mocker.Mock()
+        side_effect_mock.side_effect = Exception("Help im erroring")
+
+        def side_effect(result):
+            return side_effect_mock(result)
+
+        @event_handlers.register(event_type=DummyEventType.TEST)
+        @event_handlers.register_side_effect(
+            side_effect,
+            circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60),
+        )
+        def handler(event):
+            return "result"
+
+        def handle():
+            event = Event.objects.create(
+                type=DummyEventType.TEST, data={}, created_by=admin_user
+            )
+            event_handlers.handle(event)
+            return event.handler_logs.get().side_effect_logs.get()
+
+        with freeze_time("2020-01-01 00:00:00") as frozen_time:
+            assert handle().status == EventSideEffectLog.Status.FAILED
+            assert handle().status == EventSideEffectLog.Status.FAILED
+            assert handle().status == EventSideEffectLog.Status.CIRCUIT_OPEN
+            assert side_effect_mock.call_count == 2
+
+            frozen_time.tick(61)
+            side_effect_mock.side_effect = None
+            assert handle().status == EventSideEffectLog.Status.SUCCESS
+            assert handle().status == EventSideEffectLog.Status.SUCCESS
+
+    def test_circuit_breakers_are_per_side_effect(self):
+        event_handlers = EventHandlerRegister()
+        circuit_breaker = CircuitBreaker()
+
+        def make_side_effect():
+            def side_effect(result):
+                pass
+
+            return side_effect
+
+        first, second = make_side_effect(), make_side_effect()
+        event_handlers.register_side_effect(first, circuit_breaker=circuit_breaker)
+        event_handlers.register_side_effect(first, circuit_breaker=circuit_breaker)
+        event_handlers.register_side_effect(second, circuit_breaker=CircuitBreaker())
+        assert event_handlers.circuit_breakers[first] is circuit_breaker
+        assert event_handlers.circuit_breakers[second] is not circuit_breaker
+
+        with pytest.raises(ValueError):
+            event_handlers.register_side_effect(first, circuit_breaker=CircuitBreaker())
@@ -0,0 +1,121 @@
+import threading
+import time
+
+from django_event_sourcing.models import Event
+from django_event_sourcing.resilience import (
+    CircuitBreaker,
+    DaemonThreadPool,
+    call_with_timeout,
+    get_pool,
+)
+from django_event_sourcing.routers import EventSourcingRouter, read_after_write
+from freezegun import freeze_time
+import pytest
+
+
+class TestCallWithTimeout:
+    def test_returns_result(self):
+        assert call_with_timeout(lambda value: value, 1, "result") == "result"
+
+    def test_raises_errors(self):
+        def fail():
+            raise ValueError("Help im erroring")
+
+        with pytest.raises(ValueError):
+            call_with_timeout(fail, 1)
+
+    def test_times_out(self):
+        def hang():
+            time.sleep(0.5)
+
+        with pytest.raises(TimeoutError):
+            call_with_timeout(hang, 0.01)
+
+    def test_keeps_context(self, settings):
+        settings.EVENT_SOURCING_DATABASES = {"events": "events", "replica": "replica"}
+        router = EventSourcingRouter()
+
+        with read_after_write():
+            assert call_with_timeout(router.db_for_read, 1, Event) == "events"
+
+    def test_hung_calls_dont_hold_up_workers(self, mocker):
+        pool = DaemonThreadPool(max_workers=2)
+        mocker.patch("django_event_sourcing.resilience._pool", pool)
+        release = threading.Event()
+        hung_threads = []
+
+        def hang():
+            hung_threads.append(threading.current_thread())
+            release.wait()
+
+        for _ in range(2):
+            with pytest.raises(TimeoutError):
+                call_with_timeout(hang, 0.01)
+
+        assert call_with_timeout(lambda: "healthy", 1) == "healthy"
+        assert len(pool.threads) == 2
+        assert not set(hung_threads) & set(pool.threads)
+
+        # Once their calls return, the replaced threads exit.
+        release.set()
+        for thread in hung_threads:
+            thread.join(timeout=5)
+            assert not thread.is_alive()
+
+    def test_shares_pool(self):
+        call_with_timeout(lambda: None, 1)
+        assert get_pool() is get_pool()
+
+
+class TestDaemonThreadPool:
+    def test_is_bounded(self):
+        pool = DaemonThreadPool(max_workers=1)
+        release = threading.Event()
+
+        futures = [pool.submit(release.wait) for _ in range(3)]
+        assert len(pool.threads) == 1
+        assert pool.threads[0].daemon
+
+        release.set()
+        assert [future.result(timeout=5) for future in futures] == [True] * 3
+
+    def test_skips_cancelled_calls(self, mocker):
+        pool = DaemonThreadPool(max_workers=1)
+        release = threading.Event()
+        pool.submit(release.wait)
+
+        function = mocker.Mock()
+        assert pool.submit(function).cancel()
+
+        release.set()
+        pool.submit(lambda: None).result(timeout=5)
+        function.assert_not_called()
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+        circuit_breaker.record_failure()
+        circuit_breaker.record_success()
+        circuit_breaker.record_failure()
+        assert circuit_breaker.allow()
+
+        circuit_breaker.record_failure()
+        assert circuit_breaker.is_open
+        assert not circuit_breaker.allow()
+
+    def test_probes_after_reset_timeout(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+
+        with freeze_time("2020-01-01 00:00:00") as frozen_time:
+            circuit_breaker.record_failure()
+            assert not circuit_breaker.allow()
+
+            frozen_time.tick(61)
+            assert circuit_breaker.allow()
+            assert not circuit_breaker.allow()
+
+            circuit_breaker.record_success()
+            assert not circuit_breaker.is_open
+            assert circuit_breaker.allow()
@@ -0,0 +1,135 @@
+from datetime import datetime
+
+from django.core.management import call_command
+from django.db.models import ProtectedError
+from django_event_sourcing.archive import archive_events
+from django_event_sourcing.models import Event, EventHandlerLog, EventSideEffectLog
+from django_event_sourcing.registers import EventUpcasterRegister
+from django_event_sourcing.routers import EventSourcingRouter, read_after_write
+from freezegun import freeze_time
+import pytest
+
+from .event_types import DummyEventType
+
+
+@pytest.fixture
+def databases(settings):
+    settings.EVENT_SOURCING_DATABASES = {
+        "events": "events",
+        "logs": "logs",
+        "replica": "replica",
+    }
+
+
+@pytest.fixture
+def routed_databases(databases):
+    yield
+    # The test databases are migrated without routing, so they have foreign key
+    # constraints, which rows written across databases fail when checked.
+    EventSideEffectLog.objects.using("logs").all().delete()
+    EventHandlerLog.objects.using("logs").all().delete()
+    Event.objects.using("events").all().delete()
+
+
+class TestEventSourcingRouter:
+    def test_defaults_to_default_database(self):
+        router = EventSourcingRouter()
+        assert router.db_for_read(Event) == "default"
+        assert router.db_for_write(Event) == "default"
+        assert router.db_for_write(EventHandlerLog) == "default"
+        assert router.allow_migrate("logs", "django_event_sourcing", "event") is None
+
+    def test_routes_events(self, databases):
+        router = EventSourcingRouter()
+        assert router.db_for_read(Event) == "replica"
+        assert router.db_for_write(Event) == "events"
+
+        with read_after_write():
+            assert router.db_for_read(Event) == "events"
+
+    def test_routes_logs(self, databases):
+        router = EventSourcingRouter()
+        for model in (EventHandlerLog, EventSideEffectLog):
+            assert router.db_for_read(model) == "logs"
+            assert router.db_for_write(model) == "logs"
+
+    def test_allow_migrate(self, databases):
+        router = EventSourcingRouter()
+        assert router.allow_migrate("events", "django_event_sourcing", "event")
+        assert not router.allow_migrate("logs", "django_event_sourcing", "event")
+        assert router.allow_migrate("logs", "django_event_sourcing", "eventhandlerlog")
+        assert router.allow_migrate("default", "auth", "user") is None
+
+    def test_ignores_other_apps(self, databases, admin_user):
+        router = EventSourcingRouter()
+        assert router.db_for_read(type(admin_user)) is None
+        assert router.db_for_write(type(admin_user)) is None
+
+
+@pytest.mark.django_db(databases="__all__")
+def test_create_and_handle_across_databases(routed_databases, admin_user):
+    event, _ = Event.objects.create_and_handle(
+        type=DummyEventType.TEST_ANOTHER, data={}, created_by=admin_user, atomic=True
+    )
+
+    assert Event.objects.using("events").filter(pk=event.pk).exists()
+    assert not Event.objects.using("default").filter(pk=event.pk).exists()
+    assert EventHandlerLog.objects.using("logs").filter(event_id=event.pk).exists()
+
+    # The replica isn't replicated in tests, which shows where reads go.
+    assert not Event.objects.filter(pk=event.pk).exists()
+    with read_after_write():
+        assert Event.objects.filter(pk=event.pk).exists()
+
+
+@pytest.mark.django_db(databases="__all__")
+def test_archive_events_across_databases(
+    routed_databases, admin_user, settings, tmp_path
+):
+    settings.EVENT_ARCHIVE_ROOT = str(tmp_path)
+    with freeze_time("2019-01-01"):
+        event, _ = Event.objects.create_and_handle(
+            type=DummyEventType.TEST_ANOTHER, data={}, created_by=admin_user
+        )
+
+    assert archive_events(before=datetime(2020, 1, 1)) == 1
+    assert not Event.objects.using("events").filter(pk=event.pk).exists()
+    assert not EventHandlerLog.objects.using("logs").exists()
+
+
+@pytest.mark.django_db(databases="__all__")
+def test_upcast_events_across_databases(routed_databases, admin_user, mocker):
+    upcasters = EventUpcasterRegister()
+    upcasters.register(event_type=DummyEventType.TEST, version=1)(
+        lambda data: {"text": data["message"]}
+    )
+    mocker.patch(
+        "django_event_sourcing.models.get_event_upcaster_register",
+        return_value=upcasters,
+    )
+    event = Event.objects.create(
+        type=DummyEventType.TEST, data={"message": "test"}, created_by=admin_user
+    )
+    mocker.patch.object(DummyEventType, "get_version", return_value=2)
+
+    call_command("upcast_events")
+
+    stored = Event.objects.using("events").get(pk=event.pk)
+    assert stored.data_version == 2
+    assert stored.data == {"text": "test"}
+
+
+def test_foreign_key_constraints(databases, settings):
+    field = Event._meta.get_field("created_by")
+    assert not field.db_constraint
+
+    del settings.EVENT_SOURCING_DATABASES
+    assert field.db_constraint
+
+
+@pytest.mark.django_db(databases="__all__")
+def test_protects_users_across_databases(routed_databases, admin_user):
+    Event.objects.create(type=DummyEventType.TEST, data={}, created_by=admin_user)
+
+    with pytest.raises(ProtectedError):
+        admin_user.delete()
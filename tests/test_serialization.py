@@ -0,0 +1,93 @@
+from datetime import datetime
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django_event_sourcing.models import Event, EventHandlerLog
+from django_event_sourcing.serialization import insert_events
+from freezegun import freeze_time
+import pytest
+
+from .event_types import DummyEventType
+
+
+@pytest.fixture
+def events(admin_user):
+    events = []
+    for i, date in enumerate(["2019-01-01", "2020-01-01", "2021-01-01"]):
+        with freeze_time(date):
+            events.append(
+                Event.objects.create(
+                    type=DummyEventType.TEST_ANOTHER if i else DummyEventType.TEST,
+                    data={"message": f"test {i}"},
+                    created_by=admin_user,
+                )
+            )
+    return events
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_export_and_import(tmp_path, events, compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    path = str(tmp_path / "events.jsonl")
+
+    call_command("export_events", path, compression=compression)
+    Event.objects.all().delete()
+    call_command("import_events", path, compression=compression, batch_size=2)
+
+    imported = list(Event.objects.order_by("created_at"))
+    assert [event.pk for event in imported] == [event.pk for event in events]
+    assert imported[0].created_at == datetime(2019, 1, 1)
+    assert imported[0].type == DummyEventType.TEST
+    assert imported[0].data == {"message": "test 0"}
+    assert not EventHandlerLog.objects.exists()
+
+
+def test_export_filters(tmp_path, events):
+    path = str(tmp_path / "events.jsonl.gz")
+
+    call_command(
+        "export_events",
+        path,
+        "--type=dummy.test_another",
+        "--since=2020-06-01",
+    )
+    Event.objects.all().delete()
+    call_command("import_events", path)
+
+    assert list(Event.objects.values_list("pk", flat=True)) == [events[2].pk]
+
+
+def test_import_skips_existing_events(tmp_path, events):
+    path = str(tmp_path / "events.jsonl.gz")
+    call_command("export_events", path)
+    deleted_pk = events[1].pk
+    events[1].delete()
+
+    call_command("import_events", path, handle=True)
+
+    assert Event.objects.count() == 3
+    # Only the re-imported event is handled, by the autodiscovered handler.
+    assert list(EventHandlerLog.objects.values_list("event", "name")) == [
+        (deleted_pk, "autodiscovered_handler")
+    ]
+
+
+def test_copy_uses_a_temporary_table_per_call(mocker, events):
+    mocker.patch.object(connection, "vendor", "postgresql")
+    cursor = mocker.patch.object(connection, "cursor").return_value.__enter__()
+
+    with transaction.atomic():
+        insert_events(events[:1])
+        insert_events(events[1:])
+
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    creates = [sql for sql in statements if sql.startswith("CREATE TEMPORARY")]
+    temporary_tables = [sql.split()[3] for sql in creates]
+    assert len(set(temporary_tables)) == 2
+    for temporary_table in temporary_tables:
+        assert f"FROM {temporary_table} ON CONFLICT DO NOTHING" in "".join(statements)
+        assert f"DROP TABLE {temporary_table}" in statements
+
+    copied = cursor.copy_expert.call_args_list[1].args[1].getvalue()
+    assert len(copied.splitlines()) == 2